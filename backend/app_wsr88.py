@@ -1,14 +1,26 @@
-from flask import Flask, request, jsonify, send_file
-from processor import get_blockage
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from processor import (
+    BLOCKAGE_MODES, NATIONAL_GRID_COLS_1KM, OVERLAY_FORMATS, blockage_cache, compute_blockage, coverage_registry,
+    coverage_tile_source, get_blockage, get_terrain_profile, render_coverage_tile, site_state_cache
+)
+from coverage_format import COVERAGE_MIMETYPE, compress_body, decode_coverage_payload, pack_coverage_response
 import traceback
 from flask_cors import CORS
 import os
-from recolor import recolor_png
-import base64
-from calculate_blockage.read_dem import DemReader
-from calculate_blockage.get_1d_profile import get_1d_profile
+from recolor import COLOR_MAP, recolor_tile
+from tile_cache import TileCache, tile_etag, version_etag
+import json
+from batch import BATCH_MAX_SITES, run_batch, serialize_result
+from report import REPORT_THRESHOLDS, generate_report, report_data
+from jobs import JOB_KINDS, QueueFull, job_queue
+from metrics import (
+    count_bytes, record, render_metrics, request_timing_header, start_request_timing, stop_request_timing, timed
+)
+import time
+from calculate_blockage import BEAM_CACHE, MAX_RANGE_M
 
 app = Flask(__name__)
+BEAM_CACHE.validate(MAX_RANGE_M)
 CORS(app, resources={
     r"/api-wsr88/*": {
         "origins": [
@@ -18,10 +30,54 @@ CORS(app, resources={
     }
 })
 
+# Requests sending "X-Server-Timing: 1" get a Server-Timing header with their per-stage times
+SERVER_TIMING_HEADER = "X-Server-Timing"
+
+@app.before_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    if request.headers.get(SERVER_TIMING_HEADER) == "1":
+        g.timing_token = start_request_timing()
+
+@app.after_request
+def finish_timing(response):
+    record(
+        f"request_{request.endpoint}",
+        time.perf_counter() - g.request_start,
+        bytes_in=request.content_length or 0,
+        bytes_out=0 if response.is_streamed else (response.content_length or 0),
+    )
+    if "timing_token" in g:
+        header = request_timing_header()
+        if header:
+            response.headers["Server-Timing"] = header
+            response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+@app.teardown_request
+def reset_timing(exc):
+    # after_request is skipped when a view raises, teardown always runs
+    token = g.pop("timing_token", None)
+    if token is not None:
+        stop_request_timing(token)
+
+@app.route("/api-wsr88/metrics", methods=["GET"])
+def get_metrics():
+    gauges = {}
+    for cache_name, stats in (("blockage", blockage_cache.stats()), ("site_state", site_state_cache.stats()),
+                              ("tiles", tile_cache.stats())):
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges.setdefault(f"cache_{stat}", {})[cache_name] = value
+    return Response(render_metrics(gauges), mimetype="text/plain; version=0.0.4")
+
 @app.route("/api-wsr88/ping", methods=['GET'])
 def api_root():
     return 'pong'
 
+# gzip/zstd the binary coverage responses when the client accepts it
+COMPRESS_COVERAGE_RESPONSES = True
+
 @app.route("/api-wsr88/calculate_blockage", methods=["POST"])
 def calculate_blockage():
     try:
@@ -32,8 +88,38 @@ def calculate_blockage():
         max_alt_m = data.get("max_alt_m")
         elevation_angles = data.get("elevation_angles")
         color = data.get("color")
+        progressive = bool(data.get("progressive", False))
+        mode = data.get("mode")
+        if mode is not None and mode not in BLOCKAGE_MODES:
+            return jsonify({"detail": f"Unsupported mode: {mode}"}), 400
+        tiles = bool(data.get("tiles", False))
+        image_format = data.get("image_format")
+        if image_format is not None and image_format not in OVERLAY_FORMATS:
+            return jsonify({"detail": f"Unsupported image format: {image_format}"}), 400
 
-        print("Request received:", data)
+        # Binary body (overlay PNG + run-length coverage) for clients that ask for it
+        if request.accept_mimetypes.best_match(["application/json", COVERAGE_MIMETYPE]) == COVERAGE_MIMETYPE:
+            body = pack_coverage_response(compute_blockage(
+                easting=easting,
+                northing=northing,
+                elevation_angles_deg=elevation_angles,
+                tower_m=tower_m,
+                agl_threshold_m=max_alt_m,
+                color=color,
+                progressive=progressive,
+                mode=mode,
+                image_format=image_format,
+                tiles=tiles
+            ))
+            encoding = None
+            if COMPRESS_COVERAGE_RESPONSES:
+                body, encoding = compress_body(body, request.headers.get("Accept-Encoding"))
+            response = Response(body, mimetype=COVERAGE_MIMETYPE)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept")
+            response.vary.add("Accept-Encoding")
+            return response
 
         return jsonify(get_blockage(
             easting=easting,
@@ -41,14 +127,171 @@ def calculate_blockage():
             elevation_angles_deg=elevation_angles,
             tower_m=tower_m,
             agl_threshold_m=max_alt_m,
-            color=color
+            color=color,
+            progressive=progressive,
+            mode=mode,
+            image_format=image_format,
+            tiles=tiles
         ))
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"detail": str(e)}), 500
 
+@app.route("/api-wsr88/batch_coverage", methods=["POST"])
+def batch_coverage():
+    """
+    Evaluate many candidate sites in one call. Streams one JSON object per line
+    (application/x-ndjson) as sites finish, then a summary line with throughput.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"detail": "Request body must be a JSON object"}), 400
+    sites = data.get("sites") or []
+    if not sites:
+        return jsonify({"detail": "No sites given"}), 400
+    if len(sites) > BATCH_MAX_SITES:
+        return jsonify({"detail": f"At most {BATCH_MAX_SITES} sites per batch"}), 400
+
+    # Per-site values override the shared parameters
+    defaults = data.get("defaults") or {}
+    if not isinstance(defaults, dict) or not all(isinstance(site, dict) for site in sites):
+        return jsonify({"detail": "Sites and defaults must be JSON objects"}), 400
+    sites = [{**defaults, "id": i, **site} for i, site in enumerate(sites)]
+    for site in sites:
+        mode = site.get("mode")
+        if mode is not None and mode not in BLOCKAGE_MODES:
+            return jsonify({"detail": f"Unsupported mode for site {site['id']}: {mode}"}), 400
+    render_png = bool(data.get("render_png", False))
+    color = data.get("color", "green")
+    coverage_encoding = data.get("coverage_encoding", "runs-varint")
+
+    def generate():
+        for result in run_batch(sites, render_png=render_png, color=color):
+            yield json.dumps(serialize_result(result, coverage_encoding)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Retry-After for clients turned away while the job queue is full
+JOB_RETRY_AFTER_S = 5
+
+@app.route("/api-wsr88/jobs", methods=["POST"])
+def submit_job():
+    """
+    Run a blockage or terrain request asynchronously. Takes {"kind", "params",
+    "timeout_s"}, params being the body of /calculate_blockage or the query of
+    /get-terrain. Answers 202 with the job id, or 429 when the queue is full.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"detail": "Request body must be a JSON object"}), 400
+    kind = data.get("kind")
+    if kind not in JOB_KINDS:
+        return jsonify({"detail": f"Unknown job kind: {kind}"}), 400
+    try:
+        job_id = job_queue.submit(kind, data.get("params") or {}, data.get("timeout_s"))
+    except QueueFull as e:
+        response = jsonify({"detail": f"Too many queued jobs ({e})"})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER_S)
+        return response
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+
+    response = jsonify(job_queue.status(job_id))
+    response.status_code = 202
+    response.headers["Location"] = f"/api-wsr88/jobs/{job_id}"
+    return response
+
+@app.route("/api-wsr88/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"detail": "Unknown job"}), 404
+    return jsonify(status)
+
+@app.route("/api-wsr88/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    if not job_queue.cancel(job_id):
+        status = job_queue.status(job_id)
+        if status is None:
+            return jsonify({"detail": "Unknown job"}), 404
+        return jsonify(status), 409
+    return jsonify(job_queue.status(job_id))
+
+# HTTP status of a job's result by job status
+JOB_RESULT_STATUS = {"queued": 202, "running": 202, "failed": 500, "timeout": 504, "cancelled": 410}
+
+@app.route("/api-wsr88/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    result = job_queue.result(job_id)
+    if result is None:
+        return jsonify({"detail": "Unknown job"}), 404
+    status, payload = result
+    if status == "done":
+        return jsonify(payload)
+    if status in ("queued", "running"):
+        return jsonify(job_queue.status(job_id)), 202
+    return jsonify({"detail": payload, "status": status}), JOB_RESULT_STATUS[status]
+
+@app.route("/api-wsr88/jobs-stats", methods=["GET"])
+def get_job_stats():
+    return jsonify(job_queue.stats())
+
+@app.route("/api-wsr88/calculate_blockage/cache-stats", methods=["GET"])
+def get_blockage_cache_stats():
+    return jsonify({**blockage_cache.stats(), "site_state": site_state_cache.stats(), "coverage_ids": len(coverage_registry)})
+
+@app.route("/api-wsr88/report", methods=["POST"])
+def get_report():
+    """
+    Basin coverage report: area (1 km cells) and population covered by NEXRAD,
+    by the custom radars and by neither. Custom radars are given by their
+    coverage indices, encoded as in the batch_coverage output.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"detail": "Request body must be a JSON object"}), 400
+    basin_id = data.get("basin_id")
+    threshold = data.get("threshold", "3k_ft")
+    if basin_id is None:
+        return jsonify({"detail": "Missing basin_id"}), 400
+    if threshold not in REPORT_THRESHOLDS:
+        return jsonify({"detail": f"Unsupported threshold: {threshold}"}), 400
+    payloads = data.get("custom_coverages") or []
+    if not isinstance(payloads, list):
+        return jsonify({"detail": "custom_coverages must be a list"}), 400
+
+    try:
+        n_cells = report_data.n_cells()
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"detail": str(e)}), 500
+
+    try:
+        # No radar covers more than a grid row in one run, nor cells past the grid
+        custom_coverages = [
+            decode_coverage_payload(payload, NATIONAL_GRID_COLS_1KM, n_cells) for payload in payloads
+        ]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"detail": f"Invalid custom_coverages: {e}"}), 400
+
+    try:
+        return jsonify(generate_report(basin_id, threshold, custom_coverages))
+    except KeyError:
+        return jsonify({"detail": f"Unknown basin: {basin_id}"}), 404
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"detail": str(e)}), 500
+
 TILE_BASE_PATH = r''
+TILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+TILE_CACHE_DIR = None  # set to a directory to enable the on-disk tier
+TILE_CACHE_DISK_MAX_BYTES = 1024 * 1024 * 1024
+
+tile_cache = TileCache(TILE_CACHE_MAX_BYTES, TILE_CACHE_DIR, TILE_CACHE_DISK_MAX_BYTES)
 
 @app.route('/api-wsr88/tiles', methods=['GET'])
 def get_tile():
@@ -59,34 +302,86 @@ def get_tile():
     y = request.args.get('y')
     color = request.args.get('color')
 
+    # Custom coverages registered by /calculate_blockage with "tiles": true
+    if request.args.get('coverage_id') is not None:
+        return get_coverage_tile(request.args['coverage_id'], z, x, y, color)
+
+    if None in (layer_threshold, z, x, y, color):
+        return jsonify({'error': "Missing required parameters 'layer_threshold', 'z', 'x', 'y' or 'color'"}), 400
+    if color not in COLOR_MAP:
+        return jsonify({'error': f"Unsupported color: {color}"}), 400
+
     tile_path = os.path.join(TILE_BASE_PATH, layer_threshold, z, x, f"{y}.png") # type: ignore
 
-    if os.path.exists(tile_path):
-        img_buffer = recolor_png(tile_path, color)
-        return send_file(img_buffer, mimetype='image/png')
+    try:
+        tile_stat = os.stat(tile_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return jsonify({'error': 'Tile not found'}), 404
+
+    key = (layer_threshold, z, x, y, color)
+    etag = tile_etag(key, tile_stat)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
     else:
+        data = tile_cache.get(key, tile_path, tile_stat.st_mtime_ns, lambda: render_tile(tile_path, tile_stat, color))
+        response = Response(data, mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True  # always revalidate, the ETag makes that a cheap 304
+    return response
+
+def render_tile(tile_path, tile_stat, color):
+    with timed("tile_recolor"):
+        data = recolor_tile(tile_path, color).getvalue()
+    count_bytes("tile_recolor", bytes_in=tile_stat.st_size, bytes_out=len(data))
+    return data
+
+def get_coverage_tile(coverage_id, z, x, y, color):
+    if None in (z, x, y, color):
+        return jsonify({'error': "Missing required parameters 'z', 'x', 'y' or 'color'"}), 400
+    if color not in COLOR_MAP:
+        return jsonify({'error': f"Unsupported color: {color}"}), 400
+    try:
+        z, x, y = int(z), int(x), int(y) # type: ignore
+    except ValueError:
+        return jsonify({'error': "'z', 'x' and 'y' must be integers"}), 400
+    if not (0 <= z <= 30 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
         return jsonify({'error': 'Tile not found'}), 404
 
-dem_path = r"C:\Users\ralaya\Documents\gis\projects\wsr88-coverage-app\backend\dem1000_epsg3857.tif"
+    try:
+        source = coverage_tile_source(coverage_id)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+    if source is None:
+        return jsonify({'error': f"Unknown coverage: {coverage_id}"}), 404
+    coverage, complete = source
+
+    # Tiles cut from a progressive request's coarse result are replaced once the full one is in.
+    # Coverages never change under an id, so the key alone identifies the tile
+    key = ("coverage", coverage_id, "full" if complete else "coarse", z, x, y, color)
+    etag = version_etag(key, 0)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        data = tile_cache.get(key, None, 0, lambda: render_coverage_tile(coverage, z, x, y, color))
+        if not data:
+            return jsonify({'error': 'Tile not found'}), 404
+        response = Response(data, mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api-wsr88/tiles/cache-stats', methods=['GET'])
+def get_tile_cache_stats():
+    return jsonify(tile_cache.stats())
+
 @app.route("/api-wsr88/get-terrain")
 def get_terrain():
-    dem_reader = DemReader(dem_path)
     easting_str = request.args.get("easting")
     northing_str = request.args.get("northing")
     if easting_str is None or northing_str is None:
         return jsonify({"error": "Missing required parameters 'easting' or 'northing'"}), 400
-    easting = float(easting_str)
-    northing = float(northing_str)
-    window = dem_reader.window(easting=easting, northing=northing, window_size=920, flip=False) # we are in 3857, no need to flip
-    profile_1d = get_1d_profile(window=window, easting=easting, northing=northing)
-    profile_1d_bytes = profile_1d.tobytes()
-    profile_1d_b64 = base64.b64encode(profile_1d_bytes).decode('utf-8')
-    dem_reader.close()
-    return jsonify({
-        "terrain": profile_1d_b64,
-        "dtype": str(profile_1d.dtype),
-        "width": 230,
-    })
+    return jsonify(get_terrain_profile(float(easting_str), float(northing_str)))
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import base64
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from calculate_blockage import combine_blockage_masks, get_dem_pool
+from calculate_blockage.constants import DEM_PATH, MAX_RANGE_M, VCP12, dem_pixel_size, window_size
+from coverage_format import encode_coverage_runs
+from processor import BLOCKAGE_MODES, DEFAULT_AGL_THRESHOLD_M, DEFAULT_TOWER_M, coverage_indices_1km, render_overlay
+from reproject import warp_to_3857
+
+# Batch evaluation of many candidate sites on a process pool. Workers map the
+# same DEM (memmap backend), so they share its pages through the OS page cache
+# instead of each holding a copy. Each worker builds its own beam_height_table,
+# from the beams/ tables of precompute_beams.py where those exist.
+
+BATCH_WORKERS = 4
+BATCH_MAX_SITES = 1000
+# "spawn" keeps workers independent of the threads and GDAL state of the web process
+BATCH_MP_CONTEXT = "spawn"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_batch_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=BATCH_WORKERS,
+                mp_context=multiprocessing.get_context(BATCH_MP_CONTEXT),
+                initializer=_init_worker,
+            )
+        return _pool
+
+def _init_worker():
+    # Open (or map) the DEM once per worker rather than once per site
+    get_dem_pool(DEM_PATH)
+
+def evaluate_site(site, render_png=False, color="green"):
+    """
+    Coverage of one candidate site: 1 km coverage indices plus summary stats,
+    and the 3857 overlay PNG only when render_png is set.
+    """
+    start = time.perf_counter()
+    easting = float(site["easting"])
+    northing = float(site["northing"])
+    elevation_angles = site.get("elevation_angles") or VCP12
+    tower_m = site.get("tower_m")
+    agl_threshold_m = site.get("max_alt_m")
+    tower_m = DEFAULT_TOWER_M if tower_m is None else tower_m
+    agl_threshold_m = DEFAULT_AGL_THRESHOLD_M if agl_threshold_m is None else agl_threshold_m
+    mode = site.get("mode")
+    if mode is not None and mode not in BLOCKAGE_MODES:
+        raise ValueError(f"Unsupported mode: {mode}")
+
+    matrix_5070 = combine_blockage_masks(
+        DEM_PATH, easting, northing, elevation_angles, tower_m, agl_threshold_m, window_size,
+        viewshed=(mode == "viewshed")
+    )
+    coverage_indices = coverage_indices_1km(matrix_5070, easting, northing)
+
+    covered_cells = int(np.count_nonzero(matrix_5070))
+    pixel_area_km2 = (dem_pixel_size / 1000) ** 2
+    in_range_km2 = np.pi * (MAX_RANGE_M / 1000) ** 2
+    result = {
+        "id": site.get("id"),
+        "coverage_indices": coverage_indices,
+        "stats": {
+            "covered_km2": covered_cells * pixel_area_km2,
+            "covered_fraction": covered_cells * pixel_area_km2 / in_range_km2,
+            "covered_cells_1km": int(coverage_indices.size),
+            "elapsed_s": time.perf_counter() - start,
+        },
+    }
+
+    if render_png:
+        array, warp = warp_to_3857(matrix_5070, easting, northing, dem_pixel_size)
+        result["png"] = render_overlay(
+            {"mask_bits": np.packbits(array == 1), "shape": list(array.shape)}, color
+        )
+        result["bounds"] = dict(warp.bounds)
+
+    return result
+
+def run_batch(sites, render_png=False, color="green"):
+    """
+    Evaluate `sites` on the batch pool, yielding each result (or
+    {"id", "error"}) as soon as it finishes, then a final summary dict with
+    the throughput.
+    """
+    start = time.perf_counter()
+    pool = get_batch_pool()
+    futures = {pool.submit(evaluate_site, site, render_png, color): site for site in sites}
+
+    n_errors = 0
+    busy_s = 0.0
+    for future in as_completed(futures):
+        site = futures[future]
+        try:
+            result = future.result()
+            busy_s += result["stats"]["elapsed_s"]
+            yield result
+        except Exception as e:
+            n_errors += 1
+            yield {"id": site.get("id"), "error": str(e)}
+
+    elapsed = time.perf_counter() - start
+    yield {
+        "done": True,
+        "sites": len(sites),
+        "errors": n_errors,
+        "elapsed_s": elapsed,
+        "sites_per_s": len(sites) / elapsed if elapsed > 0 else 0.0,
+        "mean_site_s": busy_s / max(len(sites) - n_errors, 1),
+        "workers": BATCH_WORKERS,
+    }
+
+def serialize_result(result, coverage_encoding="runs-varint"):
+    """JSON-able form of a run_batch() item"""
+    if "coverage_indices" not in result:
+        return result
+    out = dict(result)
+    coverage_indices = out.pop("coverage_indices")
+    if coverage_encoding == "uint32":
+        data = coverage_indices.astype(np.uint32).tobytes()
+    else:
+        data = encode_coverage_runs(coverage_indices)
+    out["coverage_indices"] = {
+        "data": base64.b64encode(data).decode("utf-8"),
+        "encoding": coverage_encoding,
+        "count": int(coverage_indices.size),
+    }
+    if "png" in out:
+        out["image_url"] = "data:image/png;base64," + base64.b64encode(out.pop("png")).decode("utf-8")
+    return out
@@ -0,0 +1,449 @@
+# bench_backend.py
+#
+# Benchmarks of the backend hot paths on synthetic data, so no real DEM or
+# tiles are needed. The synthetic DEM has the real DEM's geotransform and
+# shape when its .npy sidecar (or GDAL and the GeoTIFF) is available, and a
+# window-sized extent at the national grid origin otherwise.
+#
+# Every case runs in a fresh process and records wall time (min/median/mean
+# over --repeat runs after a warm-up), the process's peak RSS and the peak of
+# Python/NumPy allocations during one traced run (tracemalloc). Results are
+# written as JSON and compared against a baseline: a case is flagged when its
+# median time or allocation peak grows past the tolerance, and the exit
+# status is 1 if anything was flagged.
+#
+#   python bench_backend.py                                  # compare against bench_baseline.json if present
+#   python bench_backend.py --save-baseline                  # record a new baseline
+#   python bench_backend.py --cases combine_blockage_masks --repeat 10
+#   python bench_backend.py --dem-shape 4000x4000 --out results.json --baseline old.json
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from calculate_blockage.constants import DEM_PATH, MAX_RANGE_M, VCP12, dem_pixel_size, window_size
+from calculate_blockage.read_dem import memmap_path, memmap_sidecar_path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_RESULTS_PATH = "bench_results.json"
+BENCH_BASELINE_PATH = "bench_baseline.json"
+BENCH_REPEAT = 5
+# a case regresses when it is this much slower (or allocates this much more) than the baseline...
+TIME_TOLERANCE = 0.20
+ALLOC_TOLERANCE = 0.20
+# ...and by more than these absolute amounts, so tiny cases don't flag on noise
+TIME_NOISE_S = 0.002
+ALLOC_NOISE_MB = 1.0
+SYNTHETIC_SEED = 12345
+N_TILES = 16
+TERRAIN_WINDOW_SIZE = 920
+
+class Skip(Exception):
+    pass
+
+# Synthetic inputs
+
+def real_dem_layout():
+    """(geotransform, (rows, cols)) of the real DEM, None if neither its sidecar nor GDAL + the GeoTIFF are there"""
+    sidecar = memmap_sidecar_path(memmap_path(DEM_PATH))
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            meta = json.load(f)
+        return meta["geotransform"], (meta["height"], meta["width"])
+    if gdal_available() and os.path.exists(DEM_PATH):
+        from osgeo import gdal
+        ds = gdal.Open(DEM_PATH)
+        return list(ds.GetGeoTransform()), (ds.RasterYSize, ds.RasterXSize)
+    return None
+
+def gdal_available():
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return False
+    return hasattr(gdal, "Open") and hasattr(gdal, "Warp")
+
+def synthetic_terrain(rows, cols, row0=0, seed=SYNTHETIC_SEED):
+    """Deterministic int16 terrain: a few ridge systems plus noise, in meters"""
+    rng = np.random.default_rng(seed + row0)
+    y = np.arange(row0, row0 + rows, dtype=np.float32)[:, None]
+    x = np.arange(cols, dtype=np.float32)[None, :]
+    terrain = (
+        600
+        + 400 * np.sin(x / 700) * np.cos(y / 900)
+        + 150 * np.sin((x + y) / 90)
+        + 60 * np.cos((x - 2 * y) / 23)
+    )
+    terrain += rng.normal(0, 8, (rows, cols)).astype(np.float32)
+    return np.clip(terrain, 0, None).astype(np.int16)
+
+def write_synthetic_dem(out_dir, geotransform, shape, rows_per_block=1024):
+    """Synthetic DEM as <out_dir>/dem.tif's memmap layout (.npy + sidecar), plus the GeoTIFF when GDAL is there"""
+    tif_path = os.path.join(out_dir, "dem.tif")
+    npy_path = memmap_path(tif_path)
+    rows, cols = shape
+    data = np.lib.format.open_memmap(npy_path, mode="w+", dtype=np.int16, shape=shape)
+    for row0 in range(0, rows, rows_per_block):
+        n = min(rows_per_block, rows - row0)
+        data[row0:row0 + n] = synthetic_terrain(n, cols, row0)
+    data.flush()
+    with open(memmap_sidecar_path(npy_path), "w") as f:
+        json.dump({"source": "synthetic", "geotransform": geotransform, "width": cols, "height": rows}, f)
+
+    if gdal_available():
+        from osgeo import gdal, osr
+        ds = gdal.GetDriverByName("GTiff").Create(tif_path, cols, rows, 1, gdal.GDT_Int16, options=["TILED=YES"])
+        ds.SetGeoTransform(geotransform)
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(5070)
+        ds.SetProjection(srs.ExportToWkt())
+        band = ds.GetRasterBand(1)
+        for row0 in range(0, rows, rows_per_block):
+            band.WriteArray(np.asarray(data[row0:row0 + rows_per_block]), 0, row0)
+        ds = None
+    del data
+    return tif_path
+
+def write_synthetic_tiles(out_dir, n_tiles=N_TILES, seed=SYNTHETIC_SEED):
+    """RGBA and palette coverage tiles: partly covered disks with ragged edges, like the real ones"""
+    from PIL import Image
+    from recolor import PALETTE_PLACEHOLDER_RGB, encode_palette_png
+
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:256, :256]
+    rgba_paths, palette_paths = [], []
+    for i in range(n_tiles):
+        cx, cy, r = rng.uniform(-128, 384, 2).tolist() + [rng.uniform(80, 400)]
+        mask = (xx - cx) ** 2 + (yy - cy) ** 2 < r ** 2
+        mask &= np.sin(xx / rng.uniform(3, 20)) + np.cos(yy / rng.uniform(3, 20)) > rng.uniform(-1.5, 0.5)
+        rgba = np.zeros((256, 256, 4), dtype=np.uint8)
+        rgba[mask] = (*PALETTE_PLACEHOLDER_RGB, 255)
+        rgba_path = os.path.join(out_dir, f"rgba_{i}.png")
+        Image.fromarray(rgba, mode="RGBA").save(rgba_path)
+        palette_path = os.path.join(out_dir, f"palette_{i}.png")
+        with open(palette_path, "wb") as f:
+            f.write(encode_palette_png(mask, PALETTE_PLACEHOLDER_RGB).getvalue())
+        rgba_paths.append(rgba_path)
+        palette_paths.append(palette_path)
+    return rgba_paths, palette_paths
+
+def prepare_inputs(out_dir, dem_shape=None):
+    layout = real_dem_layout()
+    if dem_shape is not None or layout is None:
+        from processor import NATIONAL_GRID_LEFT, NATIONAL_GRID_TOP
+        geotransform = [NATIONAL_GRID_LEFT, dem_pixel_size, 0, NATIONAL_GRID_TOP, 0, -dem_pixel_size]
+        shape = dem_shape or (3 * window_size, 3 * window_size)
+    else:
+        geotransform, shape = layout
+    tif_path = write_synthetic_dem(out_dir, geotransform, shape)
+    rgba_tiles, palette_tiles = write_synthetic_tiles(out_dir)
+
+    # benchmark site: the middle of the DEM
+    rows, cols = shape
+    easting = geotransform[0] + geotransform[1] * cols / 2
+    northing = geotransform[3] + geotransform[5] * rows / 2
+    return {
+        "dem_path": tif_path,
+        "dem_shape": list(shape),
+        "geotransform": geotransform,
+        "easting": easting,
+        "northing": northing,
+        "rgba_tiles": rgba_tiles,
+        "palette_tiles": palette_tiles,
+        "synthetic_layout": "real DEM" if layout is not None and dem_shape is None else "default",
+    }
+
+# Cases: each takes the inputs and returns the callable to time
+
+def case_dem_window_gdal(env):
+    if not gdal_available():
+        raise Skip("GDAL not available")
+    from calculate_blockage import DemReader
+    reader = DemReader(env["dem_path"])
+    return lambda: reader.window(env["easting"], env["northing"], window_size, flip=True)
+
+def case_dem_window_memmap(env):
+    from calculate_blockage import MemmapDemReader
+    reader = MemmapDemReader(memmap_path(env["dem_path"]))
+    # the window is a view, so copy it to include the page-cache reads
+    return lambda: np.ascontiguousarray(reader.window(env["easting"], env["northing"], window_size, flip=True))
+
+def case_ground_range_grid(env):
+    from calculate_blockage import ground_range_grid
+    # the uncached function, the grid itself is built once per process
+    return lambda: ground_range_grid.__wrapped__(window_size, dem_pixel_size)
+
+def case_beam_height_4_3(env):
+    from calculate_blockage import beam_height_4_3, ground_range_grid, slant_range
+    ea_rad = np.deg2rad(0.05)
+    slant = slant_range(ground_range_grid(window_size, dem_pixel_size), ea_rad)
+    return lambda: beam_height_4_3(slant, ea_rad)
+
+def case_beam_height_table(env):
+    from calculate_blockage import MAX_RANGE_M, beam_height_lut, beam_height_table
+    angles = tuple(float(ea) for ea in VCP12)
+    def run():
+        # cold tables, as for the first request of a new angle set
+        beam_height_lut.cache_clear()
+        beam_height_table.cache_clear()
+        return beam_height_table(angles, MAX_RANGE_M)
+    return run
+
+def case_combine_blockage_masks(n_angles):
+    def case(env):
+        from calculate_blockage import combine_blockage_masks, get_dem_pool
+        angles = VCP12[:n_angles]
+        get_dem_pool(env["dem_path"])
+        return lambda: combine_blockage_masks(
+            env["dem_path"], env["easting"], env["northing"], angles, 30.0, 914.4, window_size, dem_pixel_size
+        )
+    return case
+
+# The API path: per-site state (lowest clearing beam, optionally with line of
+# sight) and the mask of the requested angles from it, as in processor.compute_coverage
+
+def site_window(env):
+    from calculate_blockage import get_dem_pool
+    return get_dem_pool(env["dem_path"]).window(env["easting"], env["northing"], window_size, flip=True)
+
+def case_lowest_clearing_angle(env):
+    from calculate_blockage import lowest_clearing_angle
+    elevation = site_window(env)
+    ea_degs = tuple(sorted(float(ea) for ea in VCP12))
+    return lambda: lowest_clearing_angle(elevation, ea_degs, 30.0, dem_pixel_size)
+
+def case_shadowed_clearing_angle(env):
+    from calculate_blockage import lowest_clearing_angle, shadowed_clearing_angle
+    ea_degs = tuple(sorted(float(ea) for ea in VCP12))
+    lowest = lowest_clearing_angle(site_window(env), ea_degs, 30.0, dem_pixel_size)
+    return lambda: shadowed_clearing_angle(lowest, dem_pixel_size)
+
+def case_clearance_mask(n_angles):
+    def case(env):
+        from calculate_blockage import clearance_mask, lowest_clearing_angle
+        elevation = site_window(env)
+        ea_degs = tuple(sorted(float(ea) for ea in VCP12))
+        lowest = lowest_clearing_angle(elevation, ea_degs, 30.0, dem_pixel_size)
+        selected = VCP12[:n_angles]
+        return lambda: clearance_mask(elevation, lowest, ea_degs, selected, 30.0, 914.4, dem_pixel_size)
+    return case
+
+def case_get_blockage(env):
+    if not gdal_available():
+        raise Skip("GDAL not available (the overlay warp needs it)")
+    import processor
+    processor.DEM_PATH = env["dem_path"]
+    def run():
+        # cold: no cached site state, result or warp index
+        processor.blockage_cache.clear()
+        processor.site_state_cache.clear()
+        processor.warp_index.cache_clear()
+        return processor.get_blockage(env["easting"], env["northing"])
+    return run
+
+def case_get_1d_profile(env):
+    from calculate_blockage.get_1d_profile import get_1d_profile, pixel_offsets
+    window = synthetic_terrain(TERRAIN_WINDOW_SIZE, TERRAIN_WINDOW_SIZE)
+    easting, northing = -10_400_000.0, 5_000_000.0  # EPSG:3857, central US
+    def run():
+        pixel_offsets.cache_clear()
+        return get_1d_profile(window, easting, northing)
+    return run
+
+def case_recolor_png(env):
+    from recolor import recolor_png
+    return lambda: [recolor_png(path, "green") for path in env["rgba_tiles"]]
+
+def case_recolor_tile_palette(env):
+    from recolor import recolor_tile
+    return lambda: [recolor_tile(path, "green") for path in env["palette_tiles"]]
+
+CASES = {
+    "dem_window_gdal": case_dem_window_gdal,
+    "dem_window_memmap": case_dem_window_memmap,
+    "ground_range_grid": case_ground_range_grid,
+    "beam_height_4_3": case_beam_height_4_3,
+    "beam_height_table": case_beam_height_table,
+    "combine_blockage_masks[1]": case_combine_blockage_masks(1),
+    "combine_blockage_masks[4]": case_combine_blockage_masks(4),
+    "combine_blockage_masks[14]": case_combine_blockage_masks(14),
+    "lowest_clearing_angle": case_lowest_clearing_angle,
+    "shadowed_clearing_angle": case_shadowed_clearing_angle,
+    "clearance_mask[1]": case_clearance_mask(1),
+    "clearance_mask[14]": case_clearance_mask(14),
+    "get_blockage": case_get_blockage,
+    "get_1d_profile": case_get_1d_profile,
+    f"recolor_png[{N_TILES} tiles]": case_recolor_png,
+    f"recolor_tile_palette[{N_TILES} tiles]": case_recolor_tile_palette,
+}
+
+# Measurement
+
+def peak_rss_mb():
+    # VmHWM starts over in a spawned process, ru_maxrss keeps the parent's peak across exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_case(name, env, repeat):
+    try:
+        run = CASES[name](env)
+    except Skip as e:
+        return {"skipped": str(e)}
+    rss_setup_mb = peak_rss_mb()
+
+    run()  # warm-up: imports, lazily built tables, page cache
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rss_mb = peak_rss_mb()
+    return {
+        "repeat": repeat,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "peak_rss_mb": rss_mb,
+        "rss_growth_mb": rss_mb - rss_setup_mb if rss_mb is not None else None,
+        "alloc_peak_mb": alloc_peak / (1024 * 1024),
+    }
+
+def run_isolated(name, env, repeat):
+    # a fresh process per case, so peak RSS and warm caches don't carry over
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_case, name, env, repeat).result()
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, alloc_tolerance=ALLOC_TOLERANCE):
+    """Regressions of results against baseline, as a list of messages"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or "median_s" not in base or "median_s" not in result:
+            continue
+        slower = result["median_s"] - base["median_s"]
+        if result["median_s"] > base["median_s"] * (1 + time_tolerance) and slower > TIME_NOISE_S:
+            regressions.append(f"{name}: median {result['median_s'] * 1000:.1f} ms vs {base['median_s'] * 1000:.1f} ms "
+                               f"({result['median_s'] / base['median_s']:.2f}x)")
+        grown = result["alloc_peak_mb"] - base["alloc_peak_mb"]
+        if result["alloc_peak_mb"] > base["alloc_peak_mb"] * (1 + alloc_tolerance) and grown > ALLOC_NOISE_MB:
+            regressions.append(f"{name}: allocation peak {result['alloc_peak_mb']:.1f} MB vs {base['alloc_peak_mb']:.1f} MB")
+    return regressions
+
+def print_table(results, baseline):
+    print(f"{'case':<34} {'median ms':>10} {'min ms':>9} {'base ms':>9} {'alloc MB':>9} {'RSS MB':>8}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<34} skipped: {result['skipped']}")
+            continue
+        base = baseline.get(name, {}).get("median_s")
+        base_ms = f"{base * 1000:9.1f}" if base else f"{'-':>9}"
+        rss = f"{result['peak_rss_mb']:8.0f}" if result["peak_rss_mb"] is not None else f"{'-':>8}"
+        print(f"{name:<34} {result['median_s'] * 1000:10.1f} {result['min_s'] * 1000:9.1f} {base_ms} "
+              f"{result['alloc_peak_mb']:9.1f} {rss}")
+
+def parse_shape(value):
+    rows, _, cols = value.lower().partition("x")
+    return int(rows), int(cols or rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths on synthetic data")
+    parser.add_argument("--cases", default=None, help="comma-separated case names or prefixes (default: all)")
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT)
+    parser.add_argument("--out", default=BENCH_RESULTS_PATH)
+    parser.add_argument("--baseline", default=BENCH_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline as well")
+    parser.add_argument("--dem-shape", type=parse_shape, default=None,
+                        help="synthetic DEM ROWSxCOLS at the national grid origin (default: the real DEM's layout)")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--alloc-tolerance", type=float, default=ALLOC_TOLERANCE)
+    parser.add_argument("--in-process", action="store_true", help="run every case in this process (RSS is then cumulative)")
+    args = parser.parse_args()
+
+    names = list(CASES)
+    if args.cases:
+        prefixes = args.cases.split(",")
+        names = [name for name in names if any(name.startswith(prefix) for prefix in prefixes)]
+        if not names:
+            parser.error(f"no case matches {args.cases}; cases: {', '.join(CASES)}")
+
+    with tempfile.TemporaryDirectory(prefix="bench_backend_") as tmp_dir:
+        start = time.perf_counter()
+        env = prepare_inputs(tmp_dir, args.dem_shape)
+        print(f"synthetic DEM {env['dem_shape'][0]}x{env['dem_shape'][1]} ({env['synthetic_layout']} layout) "
+              f"in {time.perf_counter() - start:.1f} s")
+
+        results = {}
+        for name in names:
+            results[name] = (run_case if args.in_process else run_isolated)(name, env, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    output = {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "dem_shape": env["dem_shape"],
+            "window_size": window_size,
+            "max_range_m": MAX_RANGE_M,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(output, f, indent=1)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.time_tolerance, args.alloc_tolerance)
+    if not baseline:
+        print(f"no baseline at {args.baseline}; run with --save-baseline to record one")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    else:
+        print(f"no regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
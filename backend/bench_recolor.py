@@ -0,0 +1,62 @@
+# bench_recolor.py
+#
+# Compare the NumPy recolor engine against the original per-pixel implementation
+# on real coverage tiles. Every tile is checked for byte-identical output.
+#
+#   python bench_recolor.py                      # tiles under recolor.TILE_BASE_PATH
+#   python bench_recolor.py path/to/nexrad_coverages --limit 200 --repeat 3
+
+import argparse
+import os
+import time
+
+from recolor import COLOR_MAP, TILE_BASE_PATH, recolor_png, recolor_png_legacy
+
+def find_tiles(root, limit):
+    tiles = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.endswith(".png"):
+                tiles.append(os.path.join(dirpath, name))
+                if len(tiles) >= limit:
+                    return tiles
+    return tiles
+
+def time_it(fn, tiles, color, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in tiles:
+            fn(path, color)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recolor_png against recolor_png_legacy")
+    parser.add_argument("root", nargs="?", default=TILE_BASE_PATH, help="tile pyramid root")
+    parser.add_argument("--limit", type=int, default=100, help="max number of tiles to use")
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions (best is reported)")
+    parser.add_argument("--color", default="green", choices=sorted(COLOR_MAP))
+    args = parser.parse_args()
+
+    tiles = find_tiles(args.root, args.limit)
+    if not tiles:
+        raise SystemExit(f"No PNG tiles found under {args.root}")
+
+    mismatches = [
+        path for path in tiles
+        if recolor_png(path, args.color).getvalue() != recolor_png_legacy(path, args.color).getvalue()
+    ]
+    legacy_s = time_it(recolor_png_legacy, tiles, args.color, args.repeat)
+    numpy_s = time_it(recolor_png, tiles, args.color, args.repeat)
+
+    print(f"tiles:      {len(tiles)}")
+    print(f"mismatches: {len(mismatches)}")
+    for path in mismatches[:10]:
+        print(f"  {path}")
+    print(f"legacy:     {legacy_s * 1000 / len(tiles):8.2f} ms/tile")
+    print(f"numpy:      {numpy_s * 1000 / len(tiles):8.2f} ms/tile")
+    print(f"speedup:    {legacy_s / numpy_s:8.1f}x")
+
+if __name__ == "__main__":
+    main()
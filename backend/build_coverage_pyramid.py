@@ -0,0 +1,379 @@
+# build_coverage_pyramid.py
+#
+# Build the national NEXRAD coverage products from the site list with the same
+# blockage pipeline the API uses:
+#
+#   OUT/sites/<id>/<threshold>.npy      bit-packed 250 m 5070 mask of one site
+#   OUT/sites/<id>/<threshold>_1km.npy  its coverage_indices_1km
+#   OUT/mosaic_250m/<threshold>.npy     uint8 national 250 m mosaic (1 = covered)
+#   OUT/coverages/<threshold>.bin.gz    uint8 national 1 km raster (build_report_data.py --coverages)
+#   OUT/tiles/<layer>/z/x/y.png         palette tile pyramid (TILE_BASE_PATH layout, empty tiles omitted)
+#
+# Every stage is resumable and incremental. OUT/manifest.json records the
+# inputs hash of each site (site parameters, threshold, mode and
+# processor.input_version(), i.e. the blockage model version and the DEM file
+# version), so only changed sites are recomputed. A mosaic is rebuilt
+# when any of its sites changed, and only the tiles over changed sites are
+# re-cut, zoom level by zoom level.
+#
+#   python build_coverage_pyramid.py --sites nexrad_conus.json
+#   python build_coverage_pyramid.py --sites nexrad_conus.json --out build --workers 16 --zooms 5-10
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from calculate_blockage import clearance_mask, get_dem_pool, lowest_clearing_angle, shadowed_clearing_angle
+from calculate_blockage.constants import DEM_PATH, VCP12, dem_pixel_size, window_size
+from calculate_blockage.projections import transformer
+from coverage_tiles import tile_range, tile_source_pixels
+from processor import (
+    BLOCKAGE_MODES, DEFAULT_TOWER_M, NATIONAL_GRID_COLS_1KM, NATIONAL_GRID_LEFT, NATIONAL_GRID_TOP,
+    coverage_indices_1km, input_version
+)
+from recolor import PALETTE_PLACEHOLDER_RGB, encode_palette_png
+from report import REPORT_DATA_DIR, REPORT_THRESHOLDS
+from reproject import window_geotransform
+
+BUILD_DIR = "coverage_build"
+# AGL threshold of each report threshold, and the tile layer it is served as
+THRESHOLD_AGL_M = {"3k_ft": 3000 * 0.3048, "6k_ft": 6000 * 0.3048, "10k_ft": 10000 * 0.3048}
+TILE_LAYERS = {"3k_ft": "3k_tiles", "6k_ft": "6k_tiles", "10k_ft": "10k_tiles"}
+DEFAULT_ZOOMS = (5, 12)
+MOSAIC_SCALE = 1000 // dem_pixel_size  # 250 m pixels per 1 km cell
+BUILD_MP_CONTEXT = "spawn"
+
+# Stage timings
+
+class StageTimer:
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+        self.bytes_out = 0
+        self.start = time.perf_counter()
+
+    def add(self, status, n_bytes=0):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        self.bytes_out += n_bytes
+
+    def report(self, unit):
+        elapsed = time.perf_counter() - self.start
+        total = sum(self.counts.values())
+        counts = ", ".join(f"{n} {status}" for status, n in sorted(self.counts.items())) or "nothing to do"
+        print(f"{self.name}: {counts} in {elapsed:.1f} s "
+              f"({total / max(elapsed, 1e-9):.1f} {unit}/s, {self.bytes_out / 1e6:.1f} MB written)", flush=True)
+        return {"stage": self.name, "elapsed_s": elapsed, "items": total, "counts": self.counts,
+                "per_s": total / max(elapsed, 1e-9), "bytes_out": self.bytes_out}
+
+# Files
+
+def save_atomic(path, array):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def load_manifest(out):
+    try:
+        with open(os.path.join(out, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"sites": {}, "mosaics": {}, "tiles": {}}
+
+def save_manifest(out, manifest):
+    write_atomic(os.path.join(out, "manifest.json"), json.dumps(manifest, indent=1).encode())
+
+# Sites
+
+def load_sites(path, default_tower_m):
+    """Site list (nexrad_conus.json: id, lat, lng, tower) with EPSG:5070 coordinates"""
+    with open(path) as f:
+        sites = json.load(f)
+    to_5070 = transformer("EPSG:4326", "EPSG:5070")
+    to_3857 = transformer("EPSG:5070", "EPSG:3857")
+    out = {}
+    for site in sites:
+        easting, northing = to_5070.transform(float(site["lng"]), float(site["lat"]))
+        tower = site.get("tower")
+        out[str(site["id"])] = {
+            "easting": easting,
+            "northing": northing,
+            "tower_m": float(tower) if tower not in (None, "") else default_tower_m,
+            "extent_3857": window_extent_3857(to_3857, easting, northing),
+        }
+    return out
+
+def window_extent_3857(to_3857, easting, northing):
+    """EPSG:3857 bounding box of a site's blockage window, from points along its edges"""
+    left, _, _, top, _, _ = window_geotransform(easting, northing, window_size, dem_pixel_size)
+    size = window_size * dem_pixel_size
+    t = np.linspace(0, size, 17)
+    xs = np.concatenate([left + t, left + t, np.full(17, left), np.full(17, left + size)])
+    ys = np.concatenate([np.full(17, top), np.full(17, top - size), top - t, top - t])
+    mx, my = to_3857.transform(xs, ys)
+    return [float(mx.min()), float(my.min()), float(mx.max()), float(my.max())]
+
+def site_hash(site, threshold, mode, version):
+    inputs = {
+        "easting": round(site["easting"], 3),
+        "northing": round(site["northing"], 3),
+        "tower_m": site["tower_m"],
+        "agl_m": THRESHOLD_AGL_M[threshold],
+        "angles": VCP12,
+        "mode": mode,
+        "window": [window_size, dem_pixel_size],
+        "version": version,
+    }
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+def site_dir(out, site_id):
+    return os.path.join(out, "sites", site_id)
+
+def _init_site_worker():
+    get_dem_pool(DEM_PATH)
+
+def compute_site(out, site_id, site, thresholds, mode):
+    """One DEM read and clearing-angle pass per site, then a mask per threshold"""
+    start = time.perf_counter()
+    easting, northing, tower_m = site["easting"], site["northing"], site["tower_m"]
+    ea_degs = tuple(sorted(float(ea) for ea in VCP12))
+    elevation = get_dem_pool(DEM_PATH).window(easting, northing, window_size, flip=True)
+    lowest = lowest_clearing_angle(elevation, ea_degs, tower_m, dem_pixel_size)
+    if mode == "viewshed":
+        lowest = shadowed_clearing_angle(lowest, dem_pixel_size)
+
+    n_bytes = 0
+    for threshold in thresholds:
+        mask = clearance_mask(elevation, lowest, ea_degs, ea_degs, tower_m, THRESHOLD_AGL_M[threshold], dem_pixel_size)
+        bits = np.packbits(mask)
+        indices = coverage_indices_1km(mask, easting, northing)
+        save_atomic(os.path.join(site_dir(out, site_id), f"{threshold}.npy"), bits)
+        save_atomic(os.path.join(site_dir(out, site_id), f"{threshold}_1km.npy"), indices)
+        n_bytes += bits.nbytes + indices.nbytes
+    return site_id, thresholds, n_bytes, time.perf_counter() - start
+
+def build_sites(out, sites, thresholds, mode, version, manifest, workers):
+    """Recompute every (site, threshold) whose inputs hash changed"""
+    stage = StageTimer("sites")
+    todo = {}
+    for site_id, site in sites.items():
+        done = manifest["sites"].get(site_id, {}).get("hashes", {})
+        stale = [t for t in thresholds if done.get(t) != site_hash(site, t, mode, version)
+                 or not os.path.exists(os.path.join(site_dir(out, site_id), f"{t}.npy"))]
+        if stale:
+            todo[site_id] = stale
+        else:
+            stage.add("unchanged")
+
+    busy_s = 0.0
+    if todo:
+        ctx = multiprocessing.get_context(BUILD_MP_CONTEXT)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_site_worker) as pool:
+            futures = [pool.submit(compute_site, out, site_id, sites[site_id], stale, mode)
+                       for site_id, stale in todo.items()]
+            for future in as_completed(futures):
+                site_id, stale, n_bytes, elapsed = future.result()
+                busy_s += elapsed
+                entry = manifest["sites"].setdefault(site_id, {"hashes": {}})
+                entry.update({key: sites[site_id][key] for key in ("easting", "northing", "tower_m", "extent_3857")})
+                for t in stale:
+                    entry["hashes"][t] = site_hash(sites[site_id], t, mode, version)
+                # recorded as soon as a site is done, so an interrupted build resumes after it
+                save_manifest(out, manifest)
+                stage.add("computed", n_bytes)
+    report = stage.report("sites")
+    if todo:
+        print(f"  {busy_s / len(todo):.2f} s per site, {workers} workers")
+    return report
+
+# Mosaics
+
+def mosaic_shape(rows_1km):
+    return rows_1km * MOSAIC_SCALE, NATIONAL_GRID_COLS_1KM * MOSAIC_SCALE
+
+def default_rows_1km(sites):
+    """Rows of the 1 km grid: those of the report population raster if there is one, else enough for every site"""
+    population_path = os.path.join(REPORT_DATA_DIR, "population.npy")
+    if os.path.exists(population_path):
+        return np.load(population_path, mmap_mode="r").size // NATIONAL_GRID_COLS_1KM
+    half = window_size * dem_pixel_size / 2
+    return max(math.ceil((NATIONAL_GRID_TOP - (site["northing"] - half)) / 1000) for site in sites.values())
+
+def build_mosaic(out, threshold, sites, rows_1km, manifest, zooms):
+    """Rebuild a threshold's 250 m and 1 km mosaics if any of its sites changed, queueing their tiles"""
+    current = {site_id: manifest["sites"][site_id]["hashes"][threshold] for site_id in sites}
+    previous = manifest["mosaics"].get(threshold, {})
+    mosaic_path = os.path.join(out, "mosaic_250m", f"{threshold}.npy")
+    coverage_path = os.path.join(out, "coverages", f"{threshold}.bin.gz")
+    stage = StageTimer(f"mosaic {threshold}")
+
+    changed = {site_id for site_id in set(current) | set(previous.get("sites", {}))
+               if current.get(site_id) != previous.get("sites", {}).get(site_id)}
+    # zoom levels that were never built get all their tiles
+    tiles = manifest["tiles"].setdefault(threshold, {"pending": {}, "zooms": []})
+    for z in zooms:
+        if z not in tiles["zooms"]:
+            tiles["pending"][str(z)] = [manifest["sites"][s]["extent_3857"] for s in sites]
+
+    up_to_date = (not changed and previous.get("rows_1km") == rows_1km
+                  and os.path.exists(mosaic_path) and os.path.exists(coverage_path))
+    if not up_to_date:
+        height, width = mosaic_shape(rows_1km)
+        tmp_path = f"{mosaic_path}.tmp{os.getpid()}.npy"
+        os.makedirs(os.path.dirname(mosaic_path), exist_ok=True)
+        mosaic = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(height, width))
+        coverage_1km = np.zeros(rows_1km * NATIONAL_GRID_COLS_1KM, dtype=np.uint8)
+
+        for site_id in sites:
+            site = manifest["sites"][site_id]
+            bits = np.load(os.path.join(site_dir(out, site_id), f"{threshold}.npy"))
+            mask = np.unpackbits(bits, count=window_size * window_size).reshape(window_size, window_size)
+            left, _, _, top, _, _ = window_geotransform(site["easting"], site["northing"], window_size, dem_pixel_size)
+            row0 = int(round((NATIONAL_GRID_TOP - top) / dem_pixel_size))
+            col0 = int(round((left - NATIONAL_GRID_LEFT) / dem_pixel_size))
+            # clip the window to the national grid
+            r0, c0 = max(row0, 0), max(col0, 0)
+            r1, c1 = min(row0 + window_size, height), min(col0 + window_size, width)
+            if r0 < r1 and c0 < c1:
+                np.bitwise_or(mosaic[r0:r1, c0:c1], mask[r0 - row0:r1 - row0, c0 - col0:c1 - col0],
+                              out=mosaic[r0:r1, c0:c1])
+
+            indices = np.load(os.path.join(site_dir(out, site_id), f"{threshold}_1km.npy"))
+            coverage_1km[indices[indices < coverage_1km.size]] = 1
+            stage.add("merged")
+
+        mosaic.flush()
+        del mosaic
+        os.replace(tmp_path, mosaic_path)
+        write_atomic(coverage_path, gzip.compress(coverage_1km.tobytes(), compresslevel=6))
+        stage.bytes_out += os.path.getsize(mosaic_path) + os.path.getsize(coverage_path)
+
+        # tiles over every changed site (old and new windows), or everything on a fresh build
+        if previous.get("sites") and previous.get("rows_1km") == rows_1km:
+            extents = [manifest["sites"][s]["extent_3857"] for s in changed if s in manifest["sites"]]
+            extents += [previous["extents"][s] for s in changed if s in previous.get("extents", {})]
+        else:
+            extents = [manifest["sites"][s]["extent_3857"] for s in sites]
+        for z in zooms:
+            tiles["pending"].setdefault(str(z), []).extend(extents)
+
+        manifest["mosaics"][threshold] = {
+            "sites": current,
+            "extents": {s: manifest["sites"][s]["extent_3857"] for s in sites},
+            "rows_1km": rows_1km,
+            "covered_km2": int(np.count_nonzero(coverage_1km)),
+        }
+    else:
+        stage.add("unchanged")
+    save_manifest(out, manifest)
+    return stage.report("sites")
+
+# Tiles
+
+_mosaics = {}
+
+def cut_mosaic_tile(job):
+    mosaic_path, tile_path, z, x, y = job
+    mosaic = _mosaics.get(mosaic_path)
+    if mosaic is None:
+        mosaic = _mosaics[mosaic_path] = np.load(mosaic_path, mmap_mode="r")
+    height, width = mosaic.shape
+    flat, inside = tile_source_pixels(NATIONAL_GRID_LEFT, NATIONAL_GRID_TOP, dem_pixel_size, height, width, z, x, y)
+    tile = np.zeros(inside.shape, dtype=bool)
+    tile[inside] = mosaic.ravel()[flat] if flat.size else False
+    if not tile.any():
+        try:
+            os.remove(tile_path)
+            return "removed", 0
+        except FileNotFoundError:
+            return "empty", 0
+    png = encode_palette_png(tile, PALETTE_PLACEHOLDER_RGB, bit_depth=1).getvalue()
+    write_atomic(tile_path, png)
+    return "written", len(png)
+
+def build_tiles(out, threshold, manifest, zooms, workers):
+    """Cut the pending tiles of a threshold, one zoom level at a time"""
+    tiles = manifest["tiles"][threshold]
+    mosaic_path = os.path.join(out, "mosaic_250m", f"{threshold}.npy")
+    layer_dir = os.path.join(out, "tiles", TILE_LAYERS[threshold])
+    reports = []
+    ctx = multiprocessing.get_context(BUILD_MP_CONTEXT)
+    with ctx.Pool(workers) as pool:
+        for z in zooms:
+            extents = tiles["pending"].get(str(z))
+            if extents is None:
+                continue
+            stage = StageTimer(f"tiles {threshold} z{z}")
+            coords = set()
+            for extent in extents:
+                x0, y0, x1, y1 = tile_range(extent, z)
+                coords.update((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+            jobs = [(mosaic_path, os.path.join(layer_dir, str(z), str(x), f"{y}.png"), z, x, y)
+                    for x, y in sorted(coords)]
+            for status, n_bytes in pool.imap_unordered(cut_mosaic_tile, jobs, chunksize=64):
+                stage.add(status, n_bytes)
+            del tiles["pending"][str(z)]
+            if z not in tiles["zooms"]:
+                tiles["zooms"].append(z)
+            save_manifest(out, manifest)
+            reports.append(stage.report("tiles"))
+    return reports
+
+def parse_zooms(value):
+    lo, _, hi = value.partition("-")
+    return tuple(range(int(lo), int(hi or lo) + 1))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build national NEXRAD coverage mosaics and tile pyramids")
+    parser.add_argument("--sites", required=True, help="site list JSON (id, lat, lng, tower), e.g. nexrad_conus.json")
+    parser.add_argument("--out", default=BUILD_DIR)
+    parser.add_argument("--thresholds", default=",".join(REPORT_THRESHOLDS))
+    parser.add_argument("--mode", default="local", choices=BLOCKAGE_MODES)
+    parser.add_argument("--zooms", default=f"{DEFAULT_ZOOMS[0]}-{DEFAULT_ZOOMS[1]}", help="tile zoom levels, e.g. 5-12")
+    parser.add_argument("--rows", type=int, default=None, help="rows of the national 1 km grid (default: from the population raster)")
+    parser.add_argument("--tower-m", type=float, default=DEFAULT_TOWER_M, help="tower height for sites without one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-tiles", action="store_true", help="stop after the mosaics")
+    args = parser.parse_args()
+
+    thresholds = [t for t in args.thresholds.split(",") if t]
+    for threshold in thresholds:
+        if threshold not in THRESHOLD_AGL_M:
+            parser.error(f"unknown threshold {threshold}, expected one of {', '.join(THRESHOLD_AGL_M)}")
+    zooms = parse_zooms(args.zooms)
+
+    start = time.perf_counter()
+    os.makedirs(args.out, exist_ok=True)
+    manifest = load_manifest(args.out)
+    sites = load_sites(args.sites, args.tower_m)
+    rows_1km = args.rows or default_rows_1km(sites)
+    print(f"{len(sites)} sites, thresholds {', '.join(thresholds)}, 1 km grid {rows_1km} x {NATIONAL_GRID_COLS_1KM}")
+
+    stages = [build_sites(args.out, sites, thresholds, args.mode, input_version(), manifest, args.workers)]
+    for threshold in thresholds:
+        stages.append(build_mosaic(args.out, threshold, sites, rows_1km, manifest, zooms))
+    if not args.no_tiles:
+        for threshold in thresholds:
+            stages.extend(build_tiles(args.out, threshold, manifest, zooms, args.workers))
+
+    manifest["last_run"] = {"finished": time.time(), "elapsed_s": time.perf_counter() - start, "stages": stages}
+    save_manifest(args.out, manifest)
+    print(f"done in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# build_report_data.py
+#
+# Convert the report inputs the frontend used to download (ppp.bin.gz, the
+# coverages/<threshold>.bin.gz rasters and the usgsBasinMask/<usgs_id>.json
+# index files) into the memory-mappable .npy layout read by report.py.
+#
+#   python build_report_data.py --population ppp.bin.gz --coverages coverages/ --basins usgsBasinMask/
+#   python build_report_data.py ... --out other_report_data
+
+import argparse
+import base64
+import gzip
+import json
+import os
+
+import numpy as np
+
+from report import REPORT_DATA_DIR, REPORT_THRESHOLDS
+
+def read_gzip_array(path, dtype):
+    with gzip.open(path, 'rb') as f:
+        return np.frombuffer(f.read(), dtype=dtype)
+
+def convert_basin(json_path):
+    with open(json_path) as f:
+        result = json.load(f)
+    indices = np.frombuffer(base64.b64decode(result["data"]), dtype=np.dtype(result["dtype"]).newbyteorder("<"))
+    return np.unique(indices).astype(np.uint32)
+
+def save_atomic(path, array):
+    tmp_path = f"{path}.tmp{os.getpid()}.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--population", required=True, help="gzipped uint16 population raster (ppp.bin.gz)")
+    parser.add_argument("--coverages", required=True, help="directory of <threshold>.bin.gz NEXRAD coverage rasters")
+    parser.add_argument("--basins", required=True, help="directory of <usgs_id>.json basin index files")
+    parser.add_argument("--out", default=REPORT_DATA_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(args.out, "basins"), exist_ok=True)
+
+    population = read_gzip_array(args.population, "<u2").astype(np.uint16)
+    save_atomic(os.path.join(args.out, "population.npy"), population)
+    print(f"population: {population.size} cells")
+
+    for threshold in REPORT_THRESHOLDS:
+        coverage = read_gzip_array(os.path.join(args.coverages, f"{threshold}.bin.gz"), np.uint8)
+        if coverage.size != population.size:
+            raise ValueError(f"{threshold} coverage has {coverage.size} cells, population has {population.size}")
+        save_atomic(os.path.join(args.out, f"coverage_{threshold}.npy"), coverage)
+        print(f"coverage {threshold}: {int(np.count_nonzero(coverage == 1))} covered cells")
+
+    n_basins = 0
+    for name in sorted(os.listdir(args.basins)):
+        if not name.endswith(".json"):
+            continue
+        basin_id = name[:-len(".json")]
+        save_atomic(os.path.join(args.out, "basins", f"{basin_id}.npy"), convert_basin(os.path.join(args.basins, name)))
+        n_basins += 1
+    print(f"basins: {n_basins}")
@@ -1,5 +1,6 @@
-from .beam_model      import slant_range, beam_height_4_3
-from .ground_range    import ground_range_grid
-from .read_dem        import DemReader
-from .constants       import BEAM_CACHE, DEM_PATH
-from .blockage        import get_beam, calculate_blockage, combine_blockage_masks
\ No newline at end of file
+from .beam_model      import slant_range, beam_height_4_3, beam_height, beam_height_lut, beam_height_table, BEAM_CACHE
+from .ground_range    import ground_range_grid, ground_range_octant, expand_octant, range_bin_grid, within_range_mask, polar_index_maps
+from .read_dem        import DemReader, DemPool, MemmapDemReader, get_dem_pool, configure_gdal_cache, load_gdal
+from .constants       import DEM_PATH, GDAL_CACHE_MAX_BYTES, MAX_RANGE_M
+from .blockage        import lowest_clearing_angle, shadowed_clearing_angle, clearance_mask, fused_blockage_mask, combine_blockage_masks
+from .beam_cache      import BeamCache, write_beam_cache
\ No newline at end of file
@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+
+BEAM_CACHE_FORMAT = 3
+META_FILE = "meta.json"
+
+class BeamCache:
+    """
+    Precomputed beam_height_lut tables, one uncompressed float64 .npy per
+    elevation angle plus a meta.json header. A table is memory-mapped when it
+    is first looked up, so nothing is read at import time and worker processes
+    share the same pages. The tables hold exactly what beam_height_lut
+    computes, so results do not depend on whether an angle is cached.
+
+    `model` holds the beam model parameters the tables must have been built
+    with. A missing cache directory is an empty cache.
+    """
+
+    def __init__(self, cache_dir, model):
+        self.cache_dir = cache_dir
+        self.model = model
+        self.meta = None
+
+        meta_path = os.path.join(cache_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta.get("format") != BEAM_CACHE_FORMAT:
+                raise ValueError(f"{cache_dir} uses an unsupported beam cache format, rerun precompute_beams.py")
+
+    def angles(self):
+        return [float(a) for a in self.meta["angles"]] if self.meta else []
+
+    def __contains__(self, ea_deg):
+        return self.meta is not None and float(ea_deg) in self.angles()
+
+    def mismatches(self, max_range_m):
+        """{key: (cached, expected)} for every parameter the cache was built with differently"""
+        if self.meta is None:
+            return {}
+        expected = dict(self.model, max_range_m=max_range_m)
+        return {key: (self.meta.get(key), value) for key, value in expected.items() if self.meta.get(key) != value}
+
+    def get(self, ea_deg, max_range_m):
+        """Memory-mapped table for ea_deg, None if it is not cached for this model and max_range_m"""
+        if ea_deg not in self or self.mismatches(max_range_m):
+            return None
+        table = np.load(os.path.join(self.cache_dir, beam_file_name(ea_deg)), mmap_mode="r")
+        if table.shape != (max_range_m + 1,) or table.dtype != np.float64:
+            raise ValueError(f"Beam table for {ea_deg} deg has shape {table.shape} and dtype {table.dtype}, "
+                             f"expected ({max_range_m + 1},) float64")
+        return np.asarray(table)
+
+    def validate(self, max_range_m):
+        """Fail fast if the cache was built for a different model or range than the one being served"""
+        for key, (cached, expected) in self.mismatches(max_range_m).items():
+            raise ValueError(
+                f"Beam cache {self.cache_dir} was built with {key}={cached}, "
+                f"but {expected} is configured. Rerun precompute_beams.py"
+            )
+        for ea_deg in self.angles():
+            if not os.path.exists(os.path.join(self.cache_dir, beam_file_name(ea_deg))):
+                raise FileNotFoundError(f"Beam cache {self.cache_dir} is missing {beam_file_name(ea_deg)}")
+
+def beam_file_name(ea_deg):
+    return f"beam_{float(ea_deg):g}.npy"
+
+def write_beam_cache(cache_dir, tables, max_range_m, model):
+    """Write {elevation angle: beam_height_lut table} as a beam cache directory"""
+    os.makedirs(cache_dir, exist_ok=True)
+    for ea_deg, table in tables.items():
+        table = np.asarray(table, dtype=np.float64)
+        if table.shape != (max_range_m + 1,):
+            raise ValueError(f"Beam table for {ea_deg} deg has shape {table.shape}, expected ({max_range_m + 1},)")
+        np.save(os.path.join(cache_dir, beam_file_name(ea_deg)), table)
+
+    meta = {
+        "format": BEAM_CACHE_FORMAT,
+        "angles": sorted(float(a) for a in tables),
+        "dtype": "float64",
+        "max_range_m": max_range_m,
+        **model,
+        "earth_model": "Davies-Jones et al. (2019), 4/3 effective Earth radius",
+    }
+    # Written last, so a half-written cache is never picked up
+    with open(os.path.join(cache_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
@@ -1,7 +1,18 @@
+from functools import lru_cache
+
 import numpy as np
 
+from .beam_cache import BeamCache
+from .constants import BEAM_CACHE_DIR
+
 EARTH_RADIUS = 6_371_000  # meters
 K0 = 1 / (4 * EARTH_RADIUS)  # standard curvature
+BEAMWIDTH_DEG = 0.9
+
+# Parameters a precomputed beam table depends on
+BEAM_MODEL = {"beamwidth_deg": BEAMWIDTH_DEG, "earth_radius": EARTH_RADIUS, "k0": K0}
+# beam_height_lut tables written by precompute_beams.py
+BEAM_CACHE = BeamCache(BEAM_CACHE_DIR, BEAM_MODEL)
 
 def slant_range(ground_range: np.ndarray, ea_rad: float) -> np.ndarray:
     """
@@ -49,4 +60,40 @@ def beam_height_4_3(slant_range: np.ndarray, ea_rad: float) -> np.ndarray:
     H = (sin_kr / kappa) * np.sin(ea_rad) - (one_minus_cos_kr / kappa) * np.cos(ea_rad)
 
     z = np.sqrt((a + H)**2 + S**2) - a
-    return z
\ No newline at end of file
+    return z
+
+def beam_height(ground_range: np.ndarray, ea_deg: float) -> np.ndarray:
+    """
+    Height of the bottom of the beam (elevation angle minus half the beamwidth)
+    above the radar, for ground range(s) in meters.
+    """
+    ea_rad = np.deg2rad(ea_deg - (BEAMWIDTH_DEG / 2))
+    return beam_height_4_3(slant_range(ground_range, ea_rad), ea_rad)
+
+
+@lru_cache(maxsize=64)
+def beam_height_lut(ea_deg: float, max_range_m: int) -> np.ndarray:
+    """
+    beam_height for every integer ground range 0..max_range_m, as a 1D table.
+
+    ground_range_grid holds whole meters, so indexing this table with the grid
+    gives the same values as evaluating beam_height on every pixel. Angles in
+    BEAM_CACHE are memory-mapped from disk instead of computed.
+    """
+    cached = BEAM_CACHE.get(ea_deg, max_range_m)
+    if cached is not None:
+        return cached
+    lut = beam_height(np.arange(max_range_m + 1), ea_deg)
+    lut.flags.writeable = False
+    return lut
+
+@lru_cache(maxsize=16)
+def beam_height_table(ea_degs: tuple, max_range_m: int) -> np.ndarray:
+    """
+    Stacked beam_height_lut tables, shape (len(ea_degs), max_range_m + 1).
+    ea_degs must be sorted ascending; at any ground range the beam then gets
+    higher from one row to the next.
+    """
+    table = np.stack([beam_height_lut(ea, max_range_m) for ea in ea_degs])
+    table.flags.writeable = False
+    return table
@@ -1,44 +1,129 @@
 import numpy as np
-from .read_dem import DemReader
-from .ground_range import ground_range_grid
-from .beam_model import slant_range, beam_height_4_3
-from .constants import BEAM_CACHE, window_size, dem_pixel_size
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-def get_beam(ea_deg, ground_ranges):
-    if ea_deg in BEAM_CACHE:
-        return BEAM_CACHE[ea_deg]
-    adjusted_ea_deg = ea_deg - (.9/2)
-    ea_rad = np.deg2rad(adjusted_ea_deg)
-    slant_ranges = slant_range(ground_ranges, ea_rad)
-    beam = beam_height_4_3(slant_ranges, ea_rad)
-    return beam
-
-def calculate_blockage(elevation, ea_deg, tower_height, agl_threshold, ground_ranges):
-    beam = get_beam(ea_deg, ground_ranges)
-    mid = elevation.shape[0] // 2
-    tower_elev = elevation[mid, mid]
-    asl = beam + tower_elev + tower_height
-    mask = (asl > elevation) & ((asl - elevation) < agl_threshold)
-    mask[ground_ranges > 230_000] = 0
-    return mask.astype(np.uint8)
+from .read_dem import get_dem_pool
+from .ground_range import polar_index_maps, range_bin_grid, within_range_mask
+from .beam_model import beam_height_table
+from .constants import MAX_RANGE_M, window_size, dem_pixel_size
+from concurrent.futures import ThreadPoolExecutor
+
+# Rows per block of the fused kernel, small enough that a block's temporaries stay in cache
+ROW_BLOCK = 32
+BLOCKAGE_THREADS = 8
+# Rays of the polar grid used for line-of-sight blockage, ~1 pixel apart at MAX_RANGE_M
+VIEWSHED_AZIMUTHS = 5760
+
+def lowest_clearing_angle(elevation, ea_degs, tower_height, pixel_res=dem_pixel_size, row_block=ROW_BLOCK):
+    """
+    Index into the sorted angles ea_degs of the lowest beam above the terrain
+    at each pixel, len(ea_degs) where every beam is at or below it.
+
+    Beams get higher with the angle at every range, so this is a binary search
+    over the angles: work per pixel grows with log(number of angles).
+    """
+    grid_size = elevation.shape[0]
+    table = beam_height_table(tuple(ea_degs), MAX_RANGE_M)
+    n_angles, n_bins = table.shape
+    flat_table = table.ravel()
+    bins = range_bin_grid(grid_size, pixel_res, MAX_RANGE_M)
+
+    mid = grid_size // 2
+    base = elevation[mid, mid] + tower_height
+
+    # values go up to n_angles, so uint8 only holds up to 255 angles
+    lowest = np.empty((grid_size, grid_size), dtype=np.min_scalar_type(n_angles))
+
+    def _block(r0):
+        r1 = min(r0 + row_block, grid_size)
+        elev = elevation[r0:r1]
+        block_bins = bins[r0:r1]
+        lo = np.zeros(block_bins.shape, dtype=np.intp)
+        hi = np.full(block_bins.shape, n_angles, dtype=np.intp)
+        for _ in range(n_angles.bit_length()):
+            k = (lo + hi) >> 1
+            asl = flat_table[np.minimum(k, n_angles - 1) * n_bins + block_bins] + base
+            below = (asl <= elev) & (k < hi)
+            lo = np.where(below, k + 1, lo)
+            hi = np.where(below, hi, k)
+        lowest[r0:r1] = lo
+
+    # numpy releases the GIL, so row blocks run in parallel
+    with ThreadPoolExecutor(max_workers=BLOCKAGE_THREADS) as executor:
+        list(executor.map(_block, range(0, grid_size, row_block)))
+    return lowest
+
+def shadowed_clearing_angle(lowest, pixel_res=dem_pixel_size, n_azimuths=VIEWSHED_AZIMUTHS):
+    """
+    lowest_clearing_angle with line of sight: the lowest beam that clears the
+    terrain at a pixel and at every pixel between it and the radar.
+
+    A beam clears everything up to some range if its index is at least the
+    lowest clearing index of every pixel on the way, so along each ray of a
+    polar resampling of `lowest` this is a cumulative maximum. It is mapped
+    back to the window through cached index tables, and never goes below the
+    pixel's own value.
+    """
+    grid_size = lowest.shape[0]
+    polar_to_grid, grid_to_polar = polar_index_maps(grid_size, pixel_res, MAX_RANGE_M, n_azimuths)
+    polar = lowest.ravel()[polar_to_grid]
+    np.maximum.accumulate(polar, axis=1, out=polar)
+    return np.maximum(polar.ravel()[grid_to_polar], lowest)
+
+def clearance_mask(elevation, lowest, ea_degs, selected_degs, tower_height, agl_threshold,
+                   pixel_res=dem_pixel_size, row_block=ROW_BLOCK):
+    """
+    Coverage of the angles selected_degs (a subset of the sorted ea_degs),
+    given lowest = lowest_clearing_angle(elevation, ea_degs, tower_height).
+
+    The lowest selected beam above the terrain is the first selected angle at
+    or after `lowest`, found with a small lookup table. A pixel is covered if
+    that beam clears the terrain by less than agl_threshold.
+    """
+    grid_size = elevation.shape[0]
+    table = beam_height_table(tuple(ea_degs), MAX_RANGE_M)
+    n_angles, n_bins = table.shape
+    flat_table = table.ravel()
+    bins = range_bin_grid(grid_size, pixel_res, MAX_RANGE_M)
+    in_range = within_range_mask(grid_size, pixel_res, MAX_RANGE_M)
+
+    # next_selected[k]: first selected angle index >= k, n_angles if none
+    selected = np.isin(np.asarray(ea_degs), [float(ea) for ea in selected_degs])
+    next_selected = np.full(n_angles + 1, n_angles, dtype=np.intp)
+    for k in range(n_angles - 1, -1, -1):
+        next_selected[k] = k if selected[k] else next_selected[k + 1]
+
+    mid = grid_size // 2
+    base = elevation[mid, mid] + tower_height
+
+    combined = np.zeros((grid_size, grid_size), dtype=np.uint8)
+
+    def _block(r0):
+        r1 = min(r0 + row_block, grid_size)
+        elev = elevation[r0:r1]
+        angle = next_selected[lowest[r0:r1]]
+        asl = flat_table[np.minimum(angle, n_angles - 1) * n_bins + bins[r0:r1]] + base
+        combined[r0:r1] = (angle < n_angles) & ((asl - elev) < agl_threshold) & in_range[r0:r1]
+
+    with ThreadPoolExecutor(max_workers=BLOCKAGE_THREADS) as executor:
+        list(executor.map(_block, range(0, grid_size, row_block)))
+    return combined
+
+def fused_blockage_mask(elevation, elevation_angles, tower_height, agl_threshold,
+                        pixel_res=dem_pixel_size, row_block=ROW_BLOCK, viewshed=False):
+    """
+    Union of calculate_blockage over all elevation_angles in one pass.
+
+    A pixel is covered if some beam lies in (terrain, terrain + agl_threshold),
+    so it is enough to check the lowest beam above the terrain against the
+    threshold. With viewshed=True the beam must also clear all terrain between
+    the radar and the pixel.
+    """
+    ea_degs = tuple(sorted({float(ea) for ea in elevation_angles}))
+    lowest = lowest_clearing_angle(elevation, ea_degs, tower_height, pixel_res, row_block)
+    if viewshed:
+        lowest = shadowed_clearing_angle(lowest, pixel_res)
+    return clearance_mask(elevation, lowest, ea_degs, ea_degs, tower_height, agl_threshold, pixel_res, row_block)
 
 def combine_blockage_masks(dem_path, easting, northing,
                            elevation_angles, tower_height, agl_threshold,
-                           window_size=window_size, pixel_res=dem_pixel_size):
-    dem_reader = DemReader(dem_path)
-    elevation = dem_reader.window(easting, northing, window_size, flip=True)
-    dem_reader.close()
-
-    ground_ranges = ground_range_grid(window_size, pixel_res)
-
-    # helper that gets coverage per ea
-    def _mask_for_ea(ea):
-        return calculate_blockage(elevation, ea, tower_height, agl_threshold, ground_ranges)
-
-    combined = np.zeros((window_size, window_size), dtype=np.uint8)
-    with ThreadPoolExecutor(max_workers=min(len(elevation_angles), 8)) as executor:
-        futures = {executor.submit(_mask_for_ea, ea): ea for ea in elevation_angles}
-        for fut in as_completed(futures):
-            combined |= fut.result()
-    return combined
\ No newline at end of file
+                           window_size=window_size, pixel_res=dem_pixel_size, viewshed=False):
+    elevation = get_dem_pool(dem_path).window(easting, northing, window_size, flip=True)
+    return fused_blockage_mask(elevation, elevation_angles, tower_height, agl_threshold, pixel_res, viewshed=viewshed)
@@ -1,15 +1,15 @@
-import os
-import numpy as np
+DEM_PATH = "dem250_epsg5070.tif"
 
-# Beam heights cache
-if not os.path.exists("beams.npz"):
-    raise FileNotFoundError("Run precompute_beams.py first to generate beams.npz")
-_beams = np.load("beams.npz", mmap_mode="r")
-BEAM_CACHE = { float(k): _beams[k] for k in _beams.files }
+# GDAL raster block cache, shared by all open DEM handles
+GDAL_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
-DEM_PATH = "dem250_epsg5070.tif"
+# Precomputed beam height tables, see precompute_beams.py
+BEAM_CACHE_DIR = "beams"
 
 VCP12 = [0.5, 0.9, 1.3, 1.8, 2.4, 3.1, 4.0, 5.1, 6.4, 8.0, 10.0, 12.5, 15.6, 19.5]
 
 dem_pixel_size = 250
-window_size = 1840
\ No newline at end of file
+window_size = 1840
+
+# Coverage is only computed out to this ground range
+MAX_RANGE_M = 230_000
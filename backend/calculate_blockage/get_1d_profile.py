@@ -1,33 +1,65 @@
-import numpy as np
-from pyproj import Geod, Transformer
+from functools import lru_cache
 
-geod = Geod(ellps='WGS84')
+import numpy as np
 
-# Define coordinate transformers
-to_4326 = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
-to_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+from .projections import geod, transformer
 
 def transform_3857_to_4326(x, y):
-    return to_4326.transform(x, y)
+    return transformer("EPSG:3857", "EPSG:4326").transform(x, y)
 
 def transform_4326_to_3857(lon, lat):
-    return to_3857.transform(lon, lat)
+    return transformer("EPSG:4326", "EPSG:3857").transform(lon, lat)
+
+N_AZIMUTHS = 360
+N_DISTANCES = 230  # 1 km steps
 
 def get_1d_profile(window: np.ndarray, easting, northing) -> np.ndarray:
-    profile = []
+    _, lat = transform_3857_to_4326(easting, northing)
+    offset_x, offset_y = pixel_offsets(lat)
+
+    height, width = window.shape
+    ix = width // 2 + offset_x
+    iy = height // 2 + offset_y
+
+    # Samples outside the window are 0, as in get_cell_value
+    inside = (ix >= 0) & (ix < width) & (iy >= 0) & (iy < height)
+    profile = np.zeros((N_AZIMUTHS, N_DISTANCES), dtype=window.dtype)
+    profile[inside] = window[iy[inside], ix[inside]]
+    return profile.ravel().astype(np.uint16)
+
+@lru_cache(maxsize=256)
+def pixel_offsets(lat):
+    """
+    (azimuth, distance) -> pixel offset table of a 1 km EPSG:3857 window centered at `lat`.
+
+    Geodesics on the ellipsoid don't depend on the starting longitude and
+    web mercator x is linear in longitude, so the table only depends on
+    latitude and is computed from longitude 0.
+    """
+    azimuths, distances = np.meshgrid(
+        np.arange(N_AZIMUTHS, dtype=np.float64),
+        np.arange(N_DISTANCES, dtype=np.float64) * 1000,
+        indexing="ij",
+    )
+    n = azimuths.size
+    dest_lon, dest_lat, _ = geod().fwd(np.zeros(n), np.full(n, lat), azimuths.ravel(), distances.ravel())
+
+    x_coord, y_coord = transform_4326_to_3857(dest_lon, dest_lat)
+    _, center_y = transform_4326_to_3857(0.0, lat)
 
-    for azimuth in range(360):
-        for distance in range(230):
-            value = get_cell_value(window, azimuth, distance, easting, northing)
-            profile.append(value)
-    return np.array(profile).astype(np.uint16)
+    # Same rounding as int(round(...)) in get_cell_value (round half to even)
+    offset_x = np.rint(np.asarray(x_coord) / 1000).astype(np.intp).reshape(N_AZIMUTHS, N_DISTANCES)
+    offset_y = np.rint((center_y - np.asarray(y_coord)) / 1000).astype(np.intp).reshape(N_AZIMUTHS, N_DISTANCES)  # y increases downward
+    offset_x.flags.writeable = False
+    offset_y.flags.writeable = False
+    return offset_x, offset_y
 
 def get_cell_value(window, azimuth, distance, easting, northing):
     # Convert center point from EPSG:3857 to lon/lat (WGS84)
     lon, lat = transform_3857_to_4326(easting, northing)
 
     # Calculate destination point using geodesic (ellipsoidal) distance
-    dest_lon, dest_lat, _ = geod.fwd(lon, lat, azimuth, distance * 1000)
+    dest_lon, dest_lat, _ = geod().fwd(lon, lat, azimuth, distance * 1000)
 
     # Convert destination point back to EPSG:3857
     x_coord, y_coord = transform_4326_to_3857(dest_lon, dest_lat)
@@ -1,14 +1,96 @@
+from functools import lru_cache
+
 import numpy as np
 
+# The ground-range field is symmetric about both axes and both diagonals of the
+# window, so only one octant holds unique values. An octant is stored "packed":
+# entry a * (a + 1) // 2 + b holds the pixel a rows and b columns (b <= a) out
+# from the center, counting from the pixel next to the center.
+#
+# Fields derived from ground range go one step further and are never stored
+# per pixel: beam heights are 1D beam_height_lut tables over whole meters of
+# range (230,001 entries against ~424,000 in an octant of the 1840 window),
+# indexed with range_bin_grid. Those tables are what precompute_beams.py
+# caches.
+
+@lru_cache(maxsize=8)
 def ground_range_grid(grid_size: int, pixel_resolution: int) -> np.ndarray:
+    """Shared, read-only ground range (m) of every pixel from the window center"""
+    grid = expand_octant(ground_range_octant(grid_size, pixel_resolution), grid_size)
+    grid.flags.writeable = False
+    return grid
+
+def ground_range_octant(grid_size: int, pixel_resolution: int) -> np.ndarray:
+    """Packed octant of ground_range_grid, 1/8 of the work of the full grid"""
+    center = (grid_size - 1) / 2.0
+    half = (grid_size + 1) // 2
+    a, b = np.tril_indices(half)
+
+    # distance from the center of the k-th pixel out from the center
+    frac = center - np.floor(center)
+    da = a + frac
+    db = b + frac
+
+    distances = np.sqrt(da**2 + db**2) * pixel_resolution
+    return distances.astype(np.uint32)
+
+@lru_cache(maxsize=8)
+def octant_index_map(grid_size: int) -> np.ndarray:
+    """(grid_size, grid_size) index of every pixel into the packed octant"""
+    center = (grid_size - 1) / 2.0
+    q = np.floor(np.abs(np.arange(grid_size) - center)).astype(np.uint32)
+    a = np.maximum(q[:, None], q[None, :])
+    b = np.minimum(q[:, None], q[None, :])
+    index = a * (a + 1) // 2 + b
+    index.flags.writeable = False
+    return index
+
+def expand_octant(packed: np.ndarray, grid_size: int) -> np.ndarray:
+    """Full (grid_size, grid_size) grid from a packed octant, by one gather"""
+    return packed[octant_index_map(grid_size)]
+
+@lru_cache(maxsize=8)
+def range_bin_grid(grid_size: int, pixel_resolution: int, max_range_m: int) -> np.ndarray:
+    """Shared, read-only ground_range_grid clamped to max_range_m (an index into beam_height_lut tables)"""
+    bins = np.minimum(ground_range_grid(grid_size, pixel_resolution), max_range_m)
+    bins.flags.writeable = False
+    return bins
+
+@lru_cache(maxsize=8)
+def within_range_mask(grid_size: int, pixel_resolution: int, max_range_m: int) -> np.ndarray:
+    """Shared, read-only disk of pixels whose ground range is at most max_range_m"""
+    mask = ground_range_grid(grid_size, pixel_resolution) <= max_range_m
+    mask.flags.writeable = False
+    return mask
+
+@lru_cache(maxsize=4)
+def polar_index_maps(grid_size: int, pixel_resolution: int, max_range_m: int, n_azimuths: int):
+    """
+    Nearest-neighbour index tables between the window and a polar grid around
+    its center, with n_azimuths rays and range bins pixel_resolution apart
+    out to max_range_m:
+
+    - polar_to_grid, shape (n_azimuths, n_ranges): flat window index sampled by each polar cell
+    - grid_to_polar, shape (grid_size, grid_size): flat polar index of the cell each pixel falls in
+    """
     center = (grid_size - 1) / 2.0
+    n_ranges = max_range_m // pixel_resolution + 1
+    azimuths = np.arange(n_azimuths) * (2 * np.pi / n_azimuths)
 
-    x = np.arange(grid_size)
-    y = np.arange(grid_size)
-    xx, yy = np.meshgrid(x, y)
+    # Azimuths are measured in index space (clockwise from "row decreasing"), the
+    # same way in both directions, so the window's orientation doesn't matter
+    steps = np.arange(n_ranges)
+    rows = np.rint(center - np.cos(azimuths)[:, None] * steps[None, :]).astype(np.int64)
+    cols = np.rint(center + np.sin(azimuths)[:, None] * steps[None, :]).astype(np.int64)
+    polar_to_grid = (np.clip(rows, 0, grid_size - 1) * grid_size + np.clip(cols, 0, grid_size - 1)).astype(np.int32)
 
-    dx = xx - center
-    dy = yy - center
+    offsets = np.arange(grid_size) - center
+    d_row = offsets[:, None]
+    d_col = offsets[None, :]
+    azimuth_bins = np.rint(np.arctan2(d_col, -d_row) * (n_azimuths / (2 * np.pi))).astype(np.int64) % n_azimuths
+    range_bins = np.minimum(np.rint(np.hypot(d_row, d_col)).astype(np.int64), n_ranges - 1)
+    grid_to_polar = (azimuth_bins * n_ranges + range_bins).astype(np.int32)
 
-    distances = np.sqrt(dx**2 + dy**2) * pixel_resolution
-    return distances.astype(np.uint32)
\ No newline at end of file
+    polar_to_grid.flags.writeable = False
+    grid_to_polar.flags.writeable = False
+    return polar_to_grid, grid_to_polar
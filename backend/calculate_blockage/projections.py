@@ -0,0 +1,26 @@
+from functools import lru_cache
+
+# Projection objects, built on first use (or by startup.after_fork) and then
+# shared by the whole process, so no request pays for a proj.db lookup.
+# pyproj is only imported here, when the first one is built. pyproj
+# Transformers are thread-safe: each thread transparently gets its own PROJ
+# object the first time it transforms.
+
+@lru_cache(maxsize=None)
+def transformer(src_crs, dst_crs):
+    """Shared always_xy Transformer from src_crs to dst_crs"""
+    from pyproj import Transformer
+    return Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+@lru_cache(maxsize=None)
+def geod(ellps="WGS84"):
+    from pyproj import Geod
+    return Geod(ellps=ellps)
+
+@lru_cache(maxsize=None)
+def srs_wkt(epsg):
+    """WKT of an EPSG code, as GDAL's SetProjection wants it"""
+    from osgeo import osr
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    return srs.ExportToWkt()
@@ -1,8 +1,13 @@
-from osgeo import gdal
 import numpy as np
+import threading
+import json
+import os
+
+from .constants import GDAL_CACHE_MAX_BYTES
 
 class DemReader:
     def __init__(self, dem_path):
+        gdal = load_gdal()
         self.ds = gdal.Open(dem_path)
         gt = self.ds.GetGeoTransform()
         self.inv_gt = gdal.InvGeoTransform(gt)
@@ -10,34 +15,46 @@ class DemReader:
         self.width = self.ds.RasterXSize
         self.height = self.ds.RasterYSize
 
-    def window(self, easting, northing, window_size, flip=True):
+    def window(self, easting, northing, window_size, flip=True, factor=1):
+        """
+        window_size x window_size pixels around (easting, northing). With
+        factor > 1 every output pixel stands for factor x factor DEM pixels
+        (nearest neighbour), so the window covers factor times the extent;
+        GDAL serves such reads from the DEM's overviews when it has them.
+        """
+        gdal = load_gdal()
         px, py = gdal.ApplyGeoTransform(self.inv_gt, easting, northing)
         origin_x = int(round(px))
         origin_y = int(round(py))
 
-        top_left_x = origin_x - (window_size // 2)
-        top_left_y = origin_y - (window_size // 2)
+        top_left_x = origin_x - (window_size * factor // 2)
+        top_left_y = origin_y - (window_size * factor // 2)
 
-        # Calculate window bounds within DEM
-        x_off = max(top_left_x, 0)
-        y_off = max(top_left_y, 0)
-        x_end = min(top_left_x + window_size, self.width)
-        y_end = min(top_left_y + window_size, self.height)
+        # Calculate window bounds within DEM, in output pixels
+        x_start = max(-(top_left_x // factor), 0)
+        y_start = max(-(top_left_y // factor), 0)
+        x_end = min((self.width - top_left_x) // factor, window_size)
+        y_end = min((self.height - top_left_y) // factor, window_size)
 
         # How much of the window is valid DEM data
-        valid_w = x_end - x_off
-        valid_h = y_end - y_off
+        valid_w = x_end - x_start
+        valid_h = y_end - y_start
 
         # Allocate output, fill with zeros
         window = np.zeros((window_size, window_size), dtype=np.int16)
 
         # If there is any overlap, fill in data
         if valid_w > 0 and valid_h > 0:
-            arr = self.band.ReadAsArray(x_off, y_off, valid_w, valid_h) # type: ignore
-            # Compute where to place it in output window
-            dest_x = x_off - top_left_x
-            dest_y = y_off - top_left_y
-            window[dest_y:dest_y+valid_h, dest_x:dest_x+valid_w] = arr
+            x_off = top_left_x + x_start * factor
+            y_off = top_left_y + y_start * factor
+            if factor == 1:
+                arr = self.band.ReadAsArray(x_off, y_off, valid_w, valid_h) # type: ignore
+            else:
+                arr = self.band.ReadAsArray( # type: ignore
+                    x_off, y_off, valid_w * factor, valid_h * factor,
+                    buf_xsize=valid_w, buf_ysize=valid_h, resample_alg=gdal.GRIORA_NearestNeighbour
+                )
+            window[y_start:y_end, x_start:x_end] = arr
 
         if flip:
             window = np.flipud(window)
@@ -47,4 +64,185 @@ class DemReader:
     def close(self):
         self.ds = None
         self.inv_gt = None
-        self.band = None
\ No newline at end of file
+        self.band = None
+
+class DemPool:
+    """
+    Thread-safe access to one DEM. GDAL dataset handles must not be used by two
+    threads at once, so the pool keeps a stack of open DemReaders and lends one
+    to each concurrent window() call. Handles are reused across requests, so the
+    pool grows to the peak number of concurrent readers and no further.
+    """
+
+    def __init__(self, dem_path):
+        self.dem_path = dem_path
+        self._lock = threading.Lock()
+        self._idle = []
+        self._all = []
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        reader = DemReader(self.dem_path)
+        with self._lock:
+            self._all.append(reader)
+        return reader
+
+    def _release(self, reader):
+        with self._lock:
+            self._idle.append(reader)
+
+    def window(self, easting, northing, window_size, flip=True, factor=1):
+        reader = self._acquire()
+        try:
+            return reader.window(easting, northing, window_size, flip=flip, factor=factor)
+        finally:
+            self._release(reader)
+
+    def close(self):
+        with self._lock:
+            for reader in self._all:
+                reader.close()
+            self._all = []
+            self._idle = []
+
+class MemmapDemReader:
+    """
+    DEM backed by a raw row-major .npy written by convert_dem_to_npy(). The
+    array is memory-mapped, so window() needs no GDAL decode, interior windows
+    are views into the page cache (flipping included) and every worker process
+    shares the same physical pages. Windows are read-only.
+    """
+
+    def __init__(self, npy_path):
+        with open(memmap_sidecar_path(npy_path)) as f:
+            meta = json.load(f)
+        self.data = np.asarray(np.load(npy_path, mmap_mode="r"))
+        self.inv_gt = invert_geotransform(meta["geotransform"])
+        self.height, self.width = self.data.shape
+        if [self.width, self.height] != [meta["width"], meta["height"]]:
+            raise ValueError(f"{npy_path} does not match its sidecar ({meta['width']}x{meta['height']})")
+
+    def window(self, easting, northing, window_size, flip=True, factor=1):
+        a, b, c, d, e, f = self.inv_gt
+        origin_x = int(round(a + b * easting + c * northing))
+        origin_y = int(round(d + e * easting + f * northing))
+
+        top_left_x = origin_x - (window_size * factor // 2)
+        top_left_y = origin_y - (window_size * factor // 2)
+
+        # Window bounds within the DEM, in output pixels
+        x_start = max(-(top_left_x // factor), 0)
+        y_start = max(-(top_left_y // factor), 0)
+        x_end = min((self.width - top_left_x) // factor, window_size)
+        y_end = min((self.height - top_left_y) // factor, window_size)
+
+        # Coarse windows sample the DEM pixel nearest each output pixel's center
+        half = factor // 2
+        rows = slice(top_left_y + y_start * factor + half, top_left_y + y_end * factor, factor)
+        cols = slice(top_left_x + x_start * factor + half, top_left_x + x_end * factor, factor)
+
+        if x_start == 0 and y_start == 0 and x_end == window_size and y_end == window_size:
+            window = self.data[rows, cols]
+        else:
+            # Only windows that cross the DEM edge need a zero-padded copy
+            window = np.zeros((window_size, window_size), dtype=self.data.dtype)
+            if x_end > x_start and y_end > y_start:
+                window[y_start:y_end, x_start:x_end] = self.data[rows, cols]
+
+        if flip:
+            window = window[::-1]  # view with a negative row stride, no copy
+
+        return window
+
+    def close(self):
+        self.data = None
+
+def memmap_path(dem_path):
+    return os.path.splitext(dem_path)[0] + ".npy"
+
+def memmap_sidecar_path(npy_path):
+    return npy_path + ".json"
+
+def invert_geotransform(gt):
+    """Pure-Python equivalent of gdal.InvGeoTransform for a 6-term affine geotransform"""
+    x0, a, b, y0, c, d = gt
+    det = a * d - b * c
+    if det == 0:
+        raise ValueError("Geotransform is not invertible")
+    inv_a, inv_b = d / det, -b / det
+    inv_c, inv_d = -c / det, a / det
+    return (
+        -x0 * inv_a - y0 * inv_b, inv_a, inv_b,
+        -x0 * inv_c - y0 * inv_d, inv_c, inv_d,
+    )
+
+def convert_dem_to_npy(dem_path, npy_path=None, rows_per_block=1024):
+    """One-off conversion of the GeoTIFF DEM into the raw layout MemmapDemReader reads"""
+    from osgeo import gdal_array
+    npy_path = npy_path or memmap_path(dem_path)
+    ds = load_gdal().Open(dem_path)
+    band = ds.GetRasterBand(1)
+    width, height = ds.RasterXSize, ds.RasterYSize
+    dtype = gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType)
+
+    tmp_path = npy_path + ".tmp.npy"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.dtype(dtype), shape=(height, width))
+    for y in range(0, height, rows_per_block):
+        rows = min(rows_per_block, height - y)
+        out[y:y + rows] = band.ReadAsArray(0, y, width, rows)
+    out.flush()
+    del out
+
+    with open(memmap_sidecar_path(npy_path), "w") as f:
+        json.dump({
+            "source": os.path.basename(dem_path),
+            "geotransform": list(ds.GetGeoTransform()),
+            "projection": ds.GetProjection(),
+            "width": width,
+            "height": height,
+            "nodata": band.GetNoDataValue(),
+        }, f)
+    os.replace(tmp_path, npy_path)
+    ds = None
+    return npy_path
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_dem_pool(dem_path):
+    """
+    Process-wide reader for dem_path: a MemmapDemReader when a converted .npy
+    sits next to the GeoTIFF, a DemPool of GDAL handles otherwise.
+    """
+    with _pools_lock:
+        pool = _pools.get(dem_path)
+        if pool is None:
+            npy_path = memmap_path(dem_path)
+            if os.path.exists(npy_path) and os.path.exists(memmap_sidecar_path(npy_path)):
+                pool = MemmapDemReader(npy_path)
+            else:
+                pool = DemPool(dem_path)
+            _pools[dem_path] = pool
+        return pool
+
+_gdal_cache_configured = False
+
+def load_gdal():
+    """
+    osgeo.gdal, imported on first use instead of with this module (memmapped
+    DEMs never need it). Its block cache gets GDAL_CACHE_MAX_BYTES unless
+    configure_gdal_cache() sized it already.
+    """
+    from osgeo import gdal
+    if not _gdal_cache_configured:
+        configure_gdal_cache(GDAL_CACHE_MAX_BYTES)
+    return gdal
+
+def configure_gdal_cache(max_bytes):
+    """Size GDAL's raster block cache, shared by every open dataset in the process"""
+    global _gdal_cache_configured
+    from osgeo import gdal
+    gdal.SetCacheMax(int(max_bytes))
+    _gdal_cache_configured = True
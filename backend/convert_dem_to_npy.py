@@ -0,0 +1,17 @@
+# convert_dem_to_npy.py
+#
+# Convert the GeoTIFF DEM into a raw memory-mappable .npy plus a JSON sidecar
+# holding the geotransform. Once the .npy exists next to the GeoTIFF,
+# get_dem_pool serves windows from it instead of opening the GeoTIFF with GDAL.
+#
+#   python convert_dem_to_npy.py                  # converts constants.DEM_PATH
+#   python convert_dem_to_npy.py other_dem.tif
+
+import sys
+
+from calculate_blockage.constants import DEM_PATH
+from calculate_blockage.read_dem import convert_dem_to_npy
+
+if __name__ == "__main__":
+    dem_path = sys.argv[1] if len(sys.argv) > 1 else DEM_PATH
+    print(f"Wrote {convert_dem_to_npy(dem_path)}")
@@ -0,0 +1,69 @@
+# convert_tiles_to_palette.py
+#
+# Rewrite a TILE_BASE_PATH/<layer_threshold>/z/x/y.png pyramid of RGBA coverage
+# tiles into two-entry palette PNGs (index 0 transparent, index 1 covered).
+# Palette tiles are recolored by get_tile with a PLTE/tRNS swap instead of a
+# full decode/re-encode.
+#
+#   python convert_tiles_to_palette.py                          # in place, under recolor.TILE_BASE_PATH
+#   python convert_tiles_to_palette.py src_root --out dst_root --bit-depth 8 --workers 8
+
+import argparse
+import os
+import time
+from multiprocessing import Pool
+
+from recolor import (
+    PALETTE_PLACEHOLDER_RGB, TILE_BASE_PATH, encode_palette_png, png_color_type, read_coverage_mask
+)
+
+def convert_tile(job):
+    src, dst, bit_depth = job
+    if png_color_type(src) == 3:
+        if src != dst:
+            with open(src, 'rb') as f:
+                data = f.read()
+            _write_atomic(dst, data)
+        return "skipped"
+
+    mask = read_coverage_mask(src)
+    png = encode_palette_png(mask, PALETTE_PLACEHOLDER_RGB, bit_depth=bit_depth)
+    _write_atomic(dst, png.getvalue())
+    return "converted"
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def find_jobs(root, out_root, bit_depth):
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(".png"):
+                src = os.path.join(dirpath, name)
+                yield src, os.path.join(out_root, os.path.relpath(src, root)), bit_depth
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert RGBA coverage tiles to palette PNGs")
+    parser.add_argument("root", nargs="?", default=TILE_BASE_PATH, help="tile pyramid root")
+    parser.add_argument("--out", default=None, help="output root (default: rewrite in place)")
+    parser.add_argument("--bit-depth", type=int, default=1, choices=(1, 8))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    jobs = list(find_jobs(args.root, args.out or args.root, args.bit_depth))
+    counts = {"converted": 0, "skipped": 0}
+    start = time.perf_counter()
+    with Pool(args.workers) as pool:
+        for status in pool.imap_unordered(convert_tile, jobs, chunksize=64):
+            counts[status] += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"converted: {counts['converted']}")
+    print(f"skipped:   {counts['skipped']} (already palette)")
+    print(f"elapsed:   {elapsed:.1f} s ({len(jobs) / max(elapsed, 1e-9):.0f} tiles/s)")
+
+if __name__ == "__main__":
+    main()
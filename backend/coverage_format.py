@@ -0,0 +1,158 @@
+import base64
+import gzip
+import json
+import struct
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is always available
+    zstandard = None
+
+# Binary alternative to the base64-in-JSON /calculate_blockage response,
+# selected with "Accept: application/vnd.nexrad-coverage".
+#
+# Layout (integers are little-endian uint32):
+#   b"NXCV" | version | header length | header JSON | overlay PNG | coverage
+#
+# The header holds the bounds plus the byte lengths of the PNG and coverage
+# parts. Coverage indices are sorted, and covered cells come in long
+# horizontal runs, so they are sent as runs: alternating (gap since the end of
+# the previous run, run length) pairs, each as an LEB128 varint.
+COVERAGE_MIMETYPE = "application/vnd.nexrad-coverage"
+MAGIC = b"NXCV"
+VERSION = 1
+
+def encode_varints(values):
+    """LEB128-encode a 1D array of non-negative integers (< 2**35)"""
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(values.shape, dtype=np.int64)
+    for k in range(1, 5):
+        n_bytes += values >= (1 << (7 * k))
+
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    starts = np.cumsum(n_bytes) - n_bytes
+    for k in range(5):
+        sel = n_bytes > k
+        if not sel.any():
+            break
+        low_bits = (values[sel] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        continuation = (n_bytes[sel] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + k] = low_bits | continuation
+    return out.tobytes()
+
+def decode_varints(data):
+    """Inverse of encode_varints"""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if raw.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    if raw[-1] >= 0x80:
+        raise ValueError("Truncated varint")
+    ends = np.flatnonzero(raw < 0x80)
+    n_bytes = np.diff(np.concatenate(([-1], ends)))
+    # also keeps every value exact in bincount's float64 weights
+    if n_bytes.max() > 5:
+        raise ValueError("Varint longer than 5 bytes")
+    value_index = np.repeat(np.arange(ends.size), n_bytes)
+    shift = (np.arange(raw.size) - np.concatenate(([0], ends[:-1] + 1))[value_index]) * 7
+    parts = (raw & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.bincount(value_index, weights=parts, minlength=ends.size).astype(np.uint64)
+
+def encode_coverage_runs(indices):
+    """Sorted unique uint32 cell indices -> varint (gap, length) run pairs"""
+    indices = np.asarray(indices, dtype=np.int64)
+    if indices.size == 0:
+        return b""
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    run_starts = indices[np.concatenate(([0], breaks))]
+    run_lengths = np.diff(np.concatenate(([0], breaks, [indices.size])))
+    previous_ends = np.concatenate(([0], run_starts[:-1] + run_lengths[:-1]))
+    pairs = np.empty(2 * run_starts.size, dtype=np.int64)
+    pairs[0::2] = run_starts - previous_ends
+    pairs[1::2] = run_lengths
+    return encode_varints(pairs)
+
+def decode_coverage_runs(data, max_run_length=None, max_index=None):
+    """
+    Inverse of encode_coverage_runs. Runs longer than max_run_length or
+    indices at or past max_index raise ValueError, which bounds the output
+    size for untrusted input.
+    """
+    pairs = decode_varints(data).astype(np.int64)
+    if pairs.size % 2:
+        raise ValueError("Coverage runs must come in (gap, length) pairs")
+    gaps, lengths = pairs[0::2], pairs[1::2]
+    if lengths.size == 0:
+        return np.zeros(0, dtype=np.uint32)
+    # encode_coverage_runs never writes empty runs or touching runs
+    if (lengths < 1).any() or (gaps < 0).any() or (gaps[1:] < 1).any():
+        raise ValueError("Coverage runs must be non-empty and separated by gaps")
+    if max_run_length is not None and lengths.max() > max_run_length:
+        raise ValueError(f"Coverage run of {lengths.max()} cells is longer than {max_run_length}")
+    limit = max_index if max_index is not None else 2**32
+    # checked per pair first, so the sums below can't overflow
+    if gaps.max() >= limit or lengths.max() > limit:
+        raise ValueError("Coverage runs reach outside the grid")
+    run_starts = np.cumsum(gaps + np.concatenate(([0], lengths[:-1])))
+    if run_starts[-1] + lengths[-1] > limit:
+        raise ValueError("Coverage runs reach outside the grid")
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return (np.repeat(run_starts, lengths) + offsets).astype(np.uint32)
+
+def pack_coverage_response(result):
+    """compute_blockage() result -> binary response body"""
+    coverage = encode_coverage_runs(result["coverage_indices"])
+    header = json.dumps({
+        "bounds": result["bounds"],
+        "png_length": len(result["png"]),
+        "image_type": result.get("image_type", "image/png"),
+        "complete": result.get("complete", True),
+        "coverage_id": result.get("coverage_id"),
+        "coverage": {
+            "encoding": "runs-varint",
+            "count": int(result["coverage_indices"].size),
+            "length": len(coverage),
+        },
+    }).encode("utf-8")
+    return b"".join([MAGIC, struct.pack("<II", VERSION, len(header)), header, result["png"], coverage])
+
+def unpack_coverage_response(body):
+    """Binary response body -> (header, png bytes, coverage indices)"""
+    if body[:4] != MAGIC:
+        raise ValueError("Not a coverage response")
+    version, header_length = struct.unpack_from("<II", body, 4)
+    if version != VERSION:
+        raise ValueError(f"Unsupported coverage response version: {version}")
+    pos = 12
+    header = json.loads(body[pos:pos + header_length])
+    pos += header_length
+    png = body[pos:pos + header["png_length"]]
+    pos += header["png_length"]
+    coverage = decode_coverage_runs(body[pos:pos + header["coverage"]["length"]])
+    return header, png, coverage
+
+def compress_body(body, accept_encoding):
+    """Compress with zstd (if installed) or gzip when the client accepts it. Returns (body, content encoding or None)"""
+    accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").split(",")}
+    if zstandard is not None and "zstd" in accepted:
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+def decode_coverage_payload(payload, max_run_length=None, max_index=None):
+    """
+    {"data": base64, "encoding": "runs-varint" | "uint32"} (as sent by
+    batch_coverage) -> sorted uint32 indices, bounded as in decode_coverage_runs
+    """
+    data = base64.b64decode(payload["data"])
+    encoding = payload.get("encoding", "runs-varint")
+    if encoding == "runs-varint":
+        return decode_coverage_runs(data, max_run_length, max_index)
+    if encoding == "uint32":
+        indices = np.unique(np.frombuffer(data, dtype="<u4")).astype(np.uint32)
+        if max_index is not None and indices.size and int(indices[-1]) >= max_index:
+            raise ValueError(f"Coverage index {indices[-1]} is outside the grid")
+        return indices
+    raise ValueError(f"Unsupported coverage encoding: {encoding}")
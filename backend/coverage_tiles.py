@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from calculate_blockage.projections import transformer
+from reproject import window_geotransform
+
+# XYZ tiles cut from a cached EPSG:5070 blockage mask, so a custom coverage is
+# served like the precomputed NEXRAD tiles instead of as one large overlay.
+#
+# Each 3857 tile pixel takes the 5070 mask pixel under its center (nearest
+# neighbour, as the overlay warp does). The projection is smooth over a tile,
+# so only a TILE_CONTROL_STEP-spaced grid of points is transformed and the
+# rest is interpolated bilinearly.
+
+TILE_SIZE = 256
+TILE_CONTROL_STEP = 16
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244
+# registered coverage ids, oldest dropped first
+COVERAGE_REGISTRY_SIZE = 4096
+
+def tile_extent(z, x, y):
+    """(x_min, y_min, x_max, y_max) of an XYZ tile in EPSG:3857 meters"""
+    size = 2 * WEB_MERCATOR_HALF_WORLD / 2 ** z
+    x_min = -WEB_MERCATOR_HALF_WORLD + x * size
+    y_max = WEB_MERCATOR_HALF_WORLD - y * size
+    return x_min, y_max - size, x_min + size, y_max
+
+def tile_pixel_coords_5070(z, x, y, step=TILE_CONTROL_STEP):
+    """EPSG:5070 coordinates of the centers of a tile's pixels, as two (TILE_SIZE, TILE_SIZE) arrays"""
+    x_min, _, x_max, y_max = tile_extent(z, x, y)
+    res = (x_max - x_min) / TILE_SIZE
+
+    # control points every `step` pixels, including the last pixel center
+    control = np.append(np.arange(0, TILE_SIZE, step), TILE_SIZE - 1).astype(np.float64)
+    cx, cy = np.meshgrid(x_min + (control + 0.5) * res, y_max - (control + 0.5) * res)
+    ex, ey = transformer("EPSG:3857", "EPSG:5070").transform(cx, cy)
+
+    # bilinear interpolation of the control grid onto every pixel
+    pixels = np.arange(TILE_SIZE)
+    cell = np.minimum(pixels // step, control.size - 2)
+    frac = (pixels - control[cell]) / (control[cell + 1] - control[cell])
+    def interpolate(values):
+        top = values[cell][:, cell] * (1 - frac) + values[cell][:, cell + 1] * frac
+        bottom = values[cell + 1][:, cell] * (1 - frac) + values[cell + 1][:, cell + 1] * frac
+        return top * (1 - frac)[:, None] + bottom * frac[:, None]
+    return interpolate(ex), interpolate(ey)
+
+def tile_source_pixels(left, top, pixel_size, height, width, z, x, y):
+    """
+    Flat indices into a north-up (height, width) 5070 grid with top-left
+    corner (left, top) of the pixels under a tile's pixel centers, and the
+    (TILE_SIZE, TILE_SIZE) mask of tile pixels that fall on the grid
+    """
+    ex, ey = tile_pixel_coords_5070(z, x, y)
+    cols = np.floor((ex - left) / pixel_size).astype(np.intp)
+    rows = np.floor((top - ey) / pixel_size).astype(np.intp)
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    return rows[inside] * width + cols[inside], inside
+
+def cut_tile(mask_bits, window, easting, northing, pixel_size, z, x, y):
+    """
+    (TILE_SIZE, TILE_SIZE) bool tile of a north-up (window, window) 5070 mask,
+    given as np.packbits(mask), centered on (easting, northing). None if the
+    tile doesn't touch the window.
+    """
+    gt = window_geotransform(easting, northing, window, pixel_size)
+    flat, inside = tile_source_pixels(gt[0], gt[3], pixel_size, window, window, z, x, y)
+    if flat.size == 0:
+        return None
+    # read the bits straight from the packed mask rather than unpacking all of it
+    tile = np.zeros((TILE_SIZE, TILE_SIZE), dtype=bool)
+    tile[inside] = (mask_bits[flat >> 3] >> (7 - (flat & 7))) & 1
+    return tile
+
+def tile_range(extent_3857, z):
+    """Inclusive (x0, y0, x1, y1) XYZ tile range covering an EPSG:3857 (x_min, y_min, x_max, y_max) extent"""
+    n = 2 ** z
+    size = 2 * WEB_MERCATOR_HALF_WORLD / n
+    clamp = lambda v: min(max(int(v), 0), n - 1)
+    x_min, y_min, x_max, y_max = extent_3857
+    return (
+        clamp((x_min + WEB_MERCATOR_HALF_WORLD) // size),
+        clamp((WEB_MERCATOR_HALF_WORLD - y_max) // size),
+        clamp((x_max + WEB_MERCATOR_HALF_WORLD) // size),
+        clamp((WEB_MERCATOR_HALF_WORLD - y_min) // size),
+    )
+
+def coverage_id(key):
+    """Stable id of a blockage cache key, used in tile URLs"""
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+class CoverageRegistry:
+    """
+    Bounded map of coverage id -> blockage cache key, for the tile endpoint.
+
+    With `registry_dir` set, ids are also written there as small JSON files so
+    other server processes sharing the directory can serve their tiles.
+    """
+
+    def __init__(self, max_entries=COVERAGE_REGISTRY_SIZE, registry_dir=None):
+        self.max_entries = max_entries
+        self.registry_dir = registry_dir
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    def register(self, key):
+        cid = coverage_id(key)
+        with self._lock:
+            known = cid in self._keys
+            self._remember(cid, key)
+        if self.registry_dir and not known:
+            os.makedirs(self.registry_dir, exist_ok=True)
+            path = os.path.join(self.registry_dir, f"{cid}.json")
+            tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "w") as f:
+                json.dump(key, f)
+            os.replace(tmp_path, path)
+        return cid
+
+    def get(self, cid):
+        with self._lock:
+            key = self._keys.get(cid)
+            if key is not None:
+                self._keys.move_to_end(cid)
+                return key
+        if not self.registry_dir or not all(c in "0123456789abcdef" for c in cid):
+            return None
+        try:
+            with open(os.path.join(self.registry_dir, f"{cid}.json")) as f:
+                key = tuple(tuple(v) if isinstance(v, list) else v for v in json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+        with self._lock:
+            self._remember(cid, key)
+        return key
+
+    def _remember(self, cid, key):
+        self._keys[cid] = key
+        self._keys.move_to_end(cid)
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
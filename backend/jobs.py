@@ -0,0 +1,264 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import deque
+from multiprocessing.connection import wait
+
+from processor import get_blockage, get_terrain_profile
+
+# Asynchronous jobs for the CPU-bound endpoints, run on a fixed set of worker
+# processes so a burst of them can't starve the request threads that serve
+# pings and tiles. Each worker runs one job at a time; a job that runs past
+# its timeout, or is cancelled while running, has its worker killed and
+# replaced. When JOB_MAX_QUEUED jobs are already waiting, submit() raises
+# QueueFull (a 429 for the client).
+
+JOB_WORKERS = 2
+JOB_MAX_QUEUED = 32
+JOB_DEFAULT_TIMEOUT_S = 120
+JOB_MAX_TIMEOUT_S = 600
+# finished jobs (and their results) are kept this long for the client to collect
+JOB_RESULT_TTL_S = 600
+JOB_MP_CONTEXT = "spawn"
+
+def blockage_job(params):
+    return get_blockage(
+        easting=params.get("easting"),
+        northing=params.get("northing"),
+        elevation_angles_deg=params.get("elevation_angles"),
+        tower_m=params.get("tower_m"),
+        agl_threshold_m=params.get("max_alt_m"),
+        color=params.get("color", "green"),
+        mode=params.get("mode"),
+        image_format=params.get("image_format"),
+    )
+
+def terrain_job(params):
+    return get_terrain_profile(float(params["easting"]), float(params["northing"]))
+
+JOB_KINDS = {
+    "blockage": blockage_job,
+    "terrain": terrain_job,
+}
+
+FINISHED = ("done", "failed", "timeout", "cancelled")
+
+class QueueFull(Exception):
+    pass
+
+def _worker_main(conn):
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        job_id, kind, params = message
+        try:
+            conn.send((job_id, "done", JOB_KINDS[kind](params)))
+        except Exception as e:
+            conn.send((job_id, "failed", f"{type(e).__name__}: {e}"))
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job_id = None
+        self.deadline = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, result_ttl_s=JOB_RESULT_TTL_S,
+                 mp_context=JOB_MP_CONTEXT):
+        self.n_workers = workers
+        self.max_queued = max_queued
+        self.result_ttl_s = result_ttl_s
+        self._ctx = multiprocessing.get_context(mp_context)
+
+        self._lock = threading.Lock()
+        self._jobs = {}  # id -> job dict
+        self._queued = deque()
+        self._workers = []
+        self._dispatcher = None
+        # written to wake the dispatcher up when there is something new to do
+        self._wakeup_r, self._wakeup_w = self._ctx.Pipe(duplex=False)
+        self._counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "timeout": 0, "cancelled": 0}
+
+    def submit(self, kind, params, timeout_s=None):
+        """
+        Queue a job, returning its id. Raises KeyError for unknown kinds,
+        ValueError for a timeout_s that isn't a positive number and QueueFull
+        under backpressure.
+        """
+        if kind not in JOB_KINDS:
+            raise KeyError(kind)
+        if timeout_s is None:
+            timeout_s = JOB_DEFAULT_TIMEOUT_S
+        elif isinstance(timeout_s, bool) or not isinstance(timeout_s, (int, float)) or not timeout_s > 0:
+            raise ValueError(f"timeout_s must be a positive number of seconds, got {timeout_s!r}")
+        timeout_s = min(float(timeout_s), JOB_MAX_TIMEOUT_S)
+        with self._lock:
+            if len(self._queued) >= self.max_queued:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"{len(self._queued)} jobs already queued")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "id": job_id,
+                "kind": kind,
+                "params": params,
+                "status": "queued",
+                "timeout_s": timeout_s,
+                "submitted": time.time(),
+                "started": None,
+                "finished": None,
+                "result": None,
+                "error": None,
+            }
+            self._queued.append(job_id)
+            self._counters["submitted"] += 1
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run, name="job-dispatcher", daemon=True)
+                self._dispatcher.start()
+        self._wakeup()
+        return job_id
+
+    def status(self, job_id):
+        """Public view of a job (without its result), or None if unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            info = {key: job[key] for key in ("id", "kind", "status", "timeout_s", "submitted", "started", "finished", "error")}
+            if job["status"] == "queued":
+                info["position"] = self._queued.index(job_id)
+            return info
+
+    def result(self, job_id):
+        """(status, result or error message) of a job, None if unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return job["status"], job["result"] if job["status"] == "done" else job["error"]
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns False if the job is unknown or already finished"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return False
+            if job["status"] == "queued":
+                self._queued.remove(job_id)
+            self._finish(job, "cancelled", error="Cancelled")
+        self._wakeup()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "queued": len(self._queued),
+                "running": sum(1 for worker in self._workers if worker.job_id is not None),
+                "workers": self.n_workers,
+                "max_queued": self.max_queued,
+            }
+
+    def _wakeup(self):
+        self._wakeup_w.send_bytes(b"\0")
+
+    def _finish(self, job, status, result=None, error=None):
+        job["status"] = status
+        job["result"] = result
+        job["error"] = error
+        job["finished"] = time.time()
+        self._counters[status] += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._replace_dead_workers()
+                self._kill_overdue_and_cancelled()
+                self._assign()
+                self._expire()
+                busy = [worker for worker in self._workers if worker.job_id is not None]
+                deadlines = [worker.deadline for worker in busy]
+
+            # Sleep until a worker answers, something is submitted/cancelled or the next deadline
+            timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+            if timeout is None or timeout > 60:
+                timeout = 60  # still expire old results now and then
+            ready = wait([worker.conn for worker in busy] + [self._wakeup_r], timeout)
+
+            for conn in ready:
+                if conn is self._wakeup_r:
+                    while self._wakeup_r.poll():
+                        self._wakeup_r.recv_bytes()
+                    continue
+                worker = next(worker for worker in busy if worker.conn is conn)
+                try:
+                    job_id, status, payload = conn.recv()
+                except (EOFError, OSError):
+                    continue  # killed or crashed, replaced on the next pass
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                    if job is not None and job["status"] == "running":
+                        if status == "done":
+                            self._finish(job, "done", result=payload)
+                        else:
+                            self._finish(job, "failed", error=payload)
+                    worker.job_id = None
+                    worker.deadline = None
+
+    def _replace_dead_workers(self):
+        for i, worker in enumerate(self._workers):
+            if not worker.process.is_alive():
+                job = self._jobs.get(worker.job_id) if worker.job_id else None
+                if job is not None and job["status"] == "running":
+                    self._finish(job, "failed", error=f"Worker exited with code {worker.process.exitcode}")
+                worker.conn.close()
+                self._workers[i] = _Worker(self._ctx)
+        while len(self._workers) < self.n_workers:
+            self._workers.append(_Worker(self._ctx))
+
+    def _kill_overdue_and_cancelled(self):
+        now = time.monotonic()
+        for i, worker in enumerate(self._workers):
+            if worker.job_id is None:
+                continue
+            job = self._jobs.get(worker.job_id)
+            if job is not None and job["status"] == "running":
+                if now < worker.deadline:
+                    continue
+                self._finish(job, "timeout", error=f"Timed out after {job['timeout_s']:g} s")
+            # timed out, or cancelled while running: the worker is still busy with it
+            worker.kill()
+            self._workers[i] = _Worker(self._ctx)
+
+    def _assign(self):
+        for worker in self._workers:
+            if not self._queued:
+                return
+            if worker.job_id is not None:
+                continue
+            job = self._jobs[self._queued.popleft()]
+            job["status"] = "running"
+            job["started"] = time.time()
+            worker.job_id = job["id"]
+            worker.deadline = time.monotonic() + job["timeout_s"]
+            worker.conn.send((job["id"], job["kind"], job["params"]))
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl_s
+        expired = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED and job["finished"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+job_queue = JobQueue()
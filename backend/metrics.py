@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+import numpy as np
+
+# Per-stage timing of the request pipeline. Stages are timed with
+#
+#   with timed("dem_read"):
+#       ...
+#
+# and rendered in the Prometheus text format by render_metrics() (count, sum
+# and p50/p95/p99 over the last METRICS_WINDOW samples, plus bytes in/out).
+# A request can also collect its own stage times for a Server-Timing header,
+# see start_request_timing(). With METRICS_ENABLED off and no request timing
+# active, timed() returns a shared no-op context manager.
+
+METRICS_ENABLED = True
+METRICS_WINDOW = 2048
+METRICS_PREFIX = "nexrad"
+QUANTILES = (0.5, 0.95, 0.99)
+
+class _Stage:
+    __slots__ = ("samples", "count", "total", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.samples = deque(maxlen=METRICS_WINDOW)
+        self.count = 0
+        self.total = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+_lock = threading.Lock()
+_stages = {}
+_request_timings = ContextVar("request_timings", default=None)
+
+def _stage(name):
+    stage = _stages.get(name)
+    if stage is None:
+        stage = _stages.setdefault(name, _Stage())
+    return stage
+
+def record(name, seconds, bytes_in=0, bytes_out=0):
+    """Add one timing sample (and optionally byte counts) for a stage"""
+    if METRICS_ENABLED:
+        with _lock:
+            stage = _stage(name)
+            stage.samples.append(seconds)
+            stage.count += 1
+            stage.total += seconds
+            stage.bytes_in += bytes_in
+            stage.bytes_out += bytes_out
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+def count_bytes(name, bytes_in=0, bytes_out=0):
+    """Add byte counts to a stage without a timing sample"""
+    if METRICS_ENABLED:
+        with _lock:
+            stage = _stage(name)
+            stage.bytes_in += bytes_in
+            stage.bytes_out += bytes_out
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timed(name):
+    if not METRICS_ENABLED and _request_timings.get() is None:
+        return _NULL_TIMER
+    return _Timer(name)
+
+def start_request_timing():
+    """Collect stage times for the current request; returns a token for stop_request_timing"""
+    return _request_timings.set({})
+
+def request_timing_header():
+    """Server-Timing header value for the stages timed so far in this request (None if nothing was timed)"""
+    timings = _request_timings.get()
+    if not timings:
+        return None
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+def stop_request_timing(token):
+    """Stop collecting stage times for the request that start_request_timing() returned `token` for"""
+    _request_timings.reset(token)
+
+def render_metrics(gauges=None):
+    """
+    Prometheus text exposition of the stage metrics. `gauges` maps a metric
+    name to {label value: number} and is rendered with a "cache" label, for
+    the cache statistics.
+    """
+    with _lock:
+        snapshot = {
+            name: (np.array(stage.samples), stage.count, stage.total, stage.bytes_in, stage.bytes_out)
+            for name, stage in _stages.items()
+        }
+
+    seconds = f"{METRICS_PREFIX}_stage_seconds"
+    lines = [
+        f"# HELP {seconds} Time spent in each pipeline stage (quantiles over the last {METRICS_WINDOW} samples)",
+        f"# TYPE {seconds} summary",
+    ]
+    for name, (samples, count, total, _, _) in sorted(snapshot.items()):
+        if count == 0:
+            continue
+        for q, value in zip(QUANTILES, np.quantile(samples, QUANTILES)):
+            lines.append(f'{seconds}{{stage="{name}",quantile="{q}"}} {value:.6f}')
+        lines.append(f'{seconds}_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'{seconds}_count{{stage="{name}"}} {count}')
+
+    for direction, index in (("in", 3), ("out", 4)):
+        metric = f"{METRICS_PREFIX}_stage_bytes_{direction}_total"
+        lines.append(f"# HELP {metric} Bytes {'read' if direction == 'in' else 'produced'} by each pipeline stage")
+        lines.append(f"# TYPE {metric} counter")
+        for name, values in sorted(snapshot.items()):
+            if values[index]:
+                lines.append(f'{metric}{{stage="{name}"}} {values[index]}')
+
+    for metric, values in (gauges or {}).items():
+        metric = f"{METRICS_PREFIX}_{metric}"
+        lines.append(f"# TYPE {metric} gauge")
+        for label, value in sorted(values.items()):
+            lines.append(f'{metric}{{cache="{label}"}} {value}')
+
+    return "\n".join(lines) + "\n"
+
+def reset_metrics():
+    with _lock:
+        _stages.clear()
@@ -1,21 +1,19 @@
 # precompute_beams.py
 
+import argparse
 import numpy as np
-from calculate_blockage.constants import VCP12, dem_pixel_size, window_size
-from calculate_blockage.ground_range import ground_range_grid
-from calculate_blockage.beam_model import slant_range, beam_height_4_3
+from calculate_blockage.constants import VCP12, BEAM_CACHE_DIR, MAX_RANGE_M
+from calculate_blockage.beam_model import BEAM_MODEL, beam_height
+from calculate_blockage.beam_cache import write_beam_cache
 
-# build ground-range once
-ground = ground_range_grid(window_size, dem_pixel_size)
+parser = argparse.ArgumentParser(description="Precompute beam height tables for the VCP12 elevation angles")
+parser.add_argument("--out", default=BEAM_CACHE_DIR, help="beam cache directory")
+parser.add_argument("--angles", type=float, nargs="+", default=VCP12, help="elevation angles (deg) to precompute")
+args = parser.parse_args()
 
-# collect beams into a dict
-beam_dict = {}
-for ea in VCP12:
-    adjusted_ea = ea - (.9/2)
-    ea_rad = np.deg2rad(adjusted_ea)
-    sl    = slant_range(ground, ea_rad).astype(np.uint32)
-    bh    = beam_height_4_3(sl, ea_rad).astype(np.uint32)
-    beam_dict[f"{ea}"] = bh
+# beam height only depends on ground range, so one table over whole meters covers every pixel
+ground_ranges = np.arange(MAX_RANGE_M + 1)
+tables = {ea: beam_height(ground_ranges, ea) for ea in args.angles}
 
-# save all in one file
-np.savez_compressed("beams.npz", **beam_dict)
\ No newline at end of file
+# one uncompressed, memory-mappable file per angle
+write_beam_cache(args.out, tables, MAX_RANGE_M, BEAM_MODEL)
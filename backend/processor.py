@@ -1,136 +1,373 @@
-from calculate_blockage import combine_blockage_masks
+from calculate_blockage import (
+    clearance_mask, fused_blockage_mask, get_dem_pool, lowest_clearing_angle, shadowed_clearing_angle
+)
 from calculate_blockage.constants import DEM_PATH, VCP12, window_size, dem_pixel_size
+from calculate_blockage.read_dem import memmap_path
+from calculate_blockage.get_1d_profile import N_DISTANCES, get_1d_profile
 import numpy as np
-from pyproj import Transformer
-from PIL import Image
 from io import BytesIO
 import base64
-from osgeo import gdal, osr
-import numpy as np
-from io import BytesIO
-import base64
-from recolor import COLOR_MAP
+import zlib
+from reproject import resample_nearest, warp_to_3857, window_geotransform
+from recolor import COLOR_MAP, PALETTE_PLACEHOLDER_RGB, encode_palette_png, swap_palette
+from result_cache import BlockageCache, file_version
+from coverage_tiles import CoverageRegistry, cut_tile
+from metrics import count_bytes, record, timed
+from concurrent.futures import ThreadPoolExecutor
+import time
+import traceback
 
-def get_blockage(easting, northing, elevation_angles_deg=None, tower_m=None, agl_threshold_m=None, color='green'):
-    if elevation_angles_deg is None:
-        elevation_angles_deg = VCP12
-    if tower_m is None:
-        tower_m = 30.48
-    if agl_threshold_m is None:
-        agl_threshold_m = 914.4
-
-    # Generate matrix in EPSG:5070
-    matrix_5070 = combine_blockage_masks(
-        DEM_PATH, easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, window_size
-    ).astype(np.uint8)
-
-    # Save matrix to temporary in-memory GeoTIFF (EPSG:5070)
-    driver = gdal.GetDriverByName("GTiff")
-    mem_ds = driver.Create('/vsimem/5070.tif', matrix_5070.shape[1], matrix_5070.shape[0], 1, gdal.GDT_Byte)
-    mem_ds.SetGeoTransform([
-        easting - (window_size * dem_pixel_size) // 2,  # top-left x
-        dem_pixel_size,                                 # pixel width
-        0,
-        northing + (window_size * dem_pixel_size) // 2, # top-left y
-        0,
-        -dem_pixel_size                                  # pixel height (negative for north-up)
-    ])
-    srs = osr.SpatialReference()
-    srs.ImportFromEPSG(5070)
-    mem_ds.SetProjection(srs.ExportToWkt())
-    mem_ds.GetRasterBand(1).WriteArray(matrix_5070)
-    mem_ds.FlushCache()
-
-    # Reproject to EPSG:3857 using GDAL.Warp
-    gdal.Warp(
-        '/vsimem/3857.tif',
-        '/vsimem/5070.tif',
-        dstSRS='EPSG:3857',
-        resampleAlg=gdal.GRA_NearestNeighbour
-    )
+DEFAULT_TOWER_M = 30.48
+DEFAULT_AGL_THRESHOLD_M = 914.4
+
+# "local": the beam only has to be above the terrain at the pixel itself
+# "viewshed": it also has to clear all terrain between the radar and the pixel
+BLOCKAGE_MODES = ("local", "viewshed")
+DEFAULT_BLOCKAGE_MODE = "local"
+
+# National 1 km EPSG:5070 grid of the coverage reports: top-left corner and width
+NATIONAL_GRID_LEFT = -2583576
+NATIONAL_GRID_TOP = 3402178
+NATIONAL_GRID_COLS_1KM = 5221
+
+# Color-independent results are cached by site and parameters, see blockage_cache_key
+BLOCKAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+BLOCKAGE_CACHE_DIR = None  # set to a directory to enable the on-disk tier
+COORD_QUANTUM_M = 1.0
+# bumped whenever the model or the layout of cached results changes
+BLOCKAGE_MODEL_VERSION = 2
+
+blockage_cache = BlockageCache(BLOCKAGE_CACHE_MAX_BYTES, BLOCKAGE_CACHE_DIR)
+
+# Per-site state (DEM window and lowest clearing beam per pixel) that makes
+# new angle subsets and AGL thresholds for an already seen site a single pass
+# over the window. Keyed by site and tower height, shared by all clients.
+SITE_STATE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+site_state_cache = BlockageCache(SITE_STATE_CACHE_MAX_BYTES)
 
-    # To generate reports:
-    coverage_1km_res = gdal.Warp(
-        '',
-        '/vsimem/5070.tif',
-        resampleAlg=gdal.GRA_NearestNeighbour,
-        xRes=1000,
-        yRes=1000,
-        format='MEM'
+# Overlays are palette PNGs (index 0 transparent, index 1 the COLOR_MAP color),
+# encoded once per result and recolored by swapping the palette. WebP lossless
+# is available on request.
+OVERLAY_FORMATS = {"png": "image/png", "webp": "image/webp"}
+DEFAULT_OVERLAY_FORMAT = "png"
+OVERLAY_PNG_BIT_DEPTH = 1
+OVERLAY_ZLIB_LEVEL = 6
+OVERLAY_ZLIB_STRATEGY = zlib.Z_DEFAULT_STRATEGY
+OVERLAY_WEBP_METHOD = 4  # 0 (fast) .. 6 (small)
+
+# Progressive requests get a coarse result (DEM sampled every PROGRESSIVE_FACTOR
+# pixels, i.e. 1 km) right away while the full one is computed in the background
+PROGRESSIVE_FACTOR = 4
+PROGRESSIVE_THREADS = 2
+
+_progressive_executor = ThreadPoolExecutor(max_workers=PROGRESSIVE_THREADS)
+
+def _compute_in_background(key, compute):
+    """
+    Full result of a progressive request. Nobody waits on it, so failures are
+    logged here and counted as the "progressive_full_failed" stage.
+    """
+    start = time.perf_counter()
+    try:
+        blockage_cache.get(key, compute)
+    except Exception:
+        traceback.print_exc()
+        record("progressive_full_failed", time.perf_counter() - start)
+
+# coverage id -> blockage cache key of results the client views as tiles
+COVERAGE_REGISTRY_DIR = None  # set to a directory shared by all server processes
+coverage_registry = CoverageRegistry(registry_dir=COVERAGE_REGISTRY_DIR)
+
+def blockage_cache_key(easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, mode=DEFAULT_BLOCKAGE_MODE):
+    """Cache key: quantized site, normalized parameters and input_version() (blockage model and DEM)"""
+    return (
+        round(easting / COORD_QUANTUM_M) * COORD_QUANTUM_M,
+        round(northing / COORD_QUANTUM_M) * COORD_QUANTUM_M,
+        tuple(sorted({float(ea) for ea in elevation_angles_deg})),
+        round(float(tower_m), 3),
+        round(float(agl_threshold_m), 3),
+        mode,
+        input_version(),
     )
 
-    coverage_1km_res_gt = coverage_1km_res.GetGeoTransform()
-    left = coverage_1km_res_gt[0]    # top-left x coordinate
-    top = coverage_1km_res_gt[3]     # top-left y coordinate
+def input_version():
+    return f"{BLOCKAGE_MODEL_VERSION}:{file_version(DEM_PATH, memmap_path(DEM_PATH))}"
+
+def site_angles(elevation_angles_deg):
+    """Angles a site's state is computed for: VCP12 plus any others requested"""
+    return tuple(sorted({float(ea) for ea in VCP12} | {float(ea) for ea in elevation_angles_deg}))
 
-    coverage_1km_res_matrix = coverage_1km_res.GetRasterBand(1).ReadAsArray()
+def site_state(easting, northing, tower_m, ea_degs, mode=DEFAULT_BLOCKAGE_MODE):
+    key = ("site", easting, northing, round(float(tower_m), 3), ea_degs, mode, input_version())
+    return site_state_cache.get(key, lambda: compute_site_state(easting, northing, tower_m, ea_degs, mode))
+
+def compute_site_state(easting, northing, tower_m, ea_degs, mode=DEFAULT_BLOCKAGE_MODE):
+    with timed("dem_read"):
+        elevation = get_dem_pool(DEM_PATH).window(easting, northing, window_size, flip=True)
+    with timed("beam_lookup"):
+        lowest = lowest_clearing_angle(elevation, ea_degs, tower_m, dem_pixel_size)
+    if mode == "viewshed":
+        with timed("viewshed"):
+            lowest = shadowed_clearing_angle(lowest, dem_pixel_size)
+    return {
+        "elevation": elevation,
+        "lowest": lowest,
+    }
+
+def coverage_indices_1km(matrix_5070, easting, northing, pixel_size=dem_pixel_size):
+    """Sorted indices of the covered cells of a 5070 mask window in the national 1 km report grid"""
+    # To generate reports: nearest-neighbour resample of the window to 1 km
+    window_gt = window_geotransform(easting, northing, matrix_5070.shape[0], pixel_size)
+    left = window_gt[0]    # top-left x coordinate
+    top = window_gt[3]     # top-left y coordinate
+
+    coverage_1km_res_matrix = resample_nearest(matrix_5070, pixel_size, 1000)
 
     indices = np.where(coverage_1km_res_matrix == 1)
     row_indices = indices[0]
     col_indices = indices[1]
 
-    colOffset = int((left - -2583576) // 1000)
-    rowOffset = int((3402178 - top) // 1000)
+    colOffset = int((left - NATIONAL_GRID_LEFT) // 1000)
+    rowOffset = int((NATIONAL_GRID_TOP - top) // 1000)
 
     row_indices += rowOffset
     col_indices += colOffset
 
-    row_indices *= 5221
+    row_indices *= NATIONAL_GRID_COLS_1KM
     row_indices += col_indices
 
-    coverage_indices = row_indices.astype(np.uint32)
+    return row_indices.astype(np.uint32)
+
+def compute_coverage(easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, mode=DEFAULT_BLOCKAGE_MODE):
+    """Color-independent part of the pipeline: the EPSG:3857 mask (bit-packed), its bounds and the 1 km coverage indices, plus the 5070 mask for tiles"""
+    # Generate matrix in EPSG:5070 from the site's cached state
+    ea_degs = site_angles(elevation_angles_deg)
+    state = site_state(easting, northing, tower_m, ea_degs, mode)
+    with timed("mask_combine"):
+        matrix_5070 = clearance_mask(
+            state["elevation"], state["lowest"], ea_degs, elevation_angles_deg, tower_m, agl_threshold_m, dem_pixel_size
+        )
+
+    with timed("index_1km"):
+        coverage_indices = coverage_indices_1km(matrix_5070, easting, northing)
+
+    # Reproject to EPSG:3857
+    with timed("warp"):
+        array, warp = warp_to_3857(matrix_5070, easting, northing, dem_pixel_size)
 
-    coverage_indices_bytes = coverage_indices.tobytes()
-    coverage_indices_b64 = base64.b64encode(coverage_indices_bytes).decode('utf-8')
+    with timed("png_encode"):
+        overlay_png = encode_overlay_png(array == 1)
+    count_bytes("png_encode", bytes_in=array.size, bytes_out=overlay_png.size)
 
+    return {
+        "mask_bits": np.packbits(array == 1),
+        "shape": list(array.shape),
+        "bounds": dict(warp.bounds),
+        "coverage_indices": coverage_indices,
+        "overlay_png": overlay_png,
+        # the 5070 mask and its window, for cutting XYZ tiles
+        "matrix_bits": np.packbits(matrix_5070),
+        "window": [easting, northing, dem_pixel_size, matrix_5070.shape[0]],
+    }
+
+def compute_coarse_coverage(easting, northing, elevation_angles_deg, tower_m, agl_threshold_m,
+                            mode=DEFAULT_BLOCKAGE_MODE, factor=PROGRESSIVE_FACTOR):
+    """compute_coverage on the same extent at factor x the DEM pixel size, for a quick preview"""
+    pixel_size = dem_pixel_size * factor
+    coarse_window_size = window_size // factor
+    with timed("coarse_dem_read"):
+        elevation = get_dem_pool(DEM_PATH).window(easting, northing, coarse_window_size, flip=True, factor=factor)
+    with timed("coarse_mask"):
+        matrix_5070 = fused_blockage_mask(
+            elevation, elevation_angles_deg, tower_m, agl_threshold_m, pixel_size, viewshed=(mode == "viewshed")
+        )
+
+    coverage_indices = coverage_indices_1km(matrix_5070, easting, northing, pixel_size)
+    array, warp = warp_to_3857(matrix_5070, easting, northing, pixel_size)
+
+    with timed("png_encode"):
+        overlay_png = encode_overlay_png(array == 1)
+    count_bytes("png_encode", bytes_in=array.size, bytes_out=overlay_png.size)
+
+    return {
+        "mask_bits": np.packbits(array == 1),
+        "shape": list(array.shape),
+        "bounds": dict(warp.bounds),
+        "coverage_indices": coverage_indices,
+        "overlay_png": overlay_png,
+        # the 5070 mask and its window, for cutting XYZ tiles
+        "matrix_bits": np.packbits(matrix_5070),
+        "window": [easting, northing, pixel_size, matrix_5070.shape[0]],
+    }
+
+def encode_overlay_png(mask):
+    """Palette PNG of a 2D bool mask in the placeholder color, as a uint8 array (so results stay all-numpy)"""
+    png = encode_palette_png(mask, PALETTE_PLACEHOLDER_RGB, OVERLAY_PNG_BIT_DEPTH, OVERLAY_ZLIB_LEVEL, OVERLAY_ZLIB_STRATEGY)
+    return np.frombuffer(png.getvalue(), dtype=np.uint8)
 
-    # Read result and convert to PNG
-    reprojected_ds = gdal.Open('/vsimem/3857.tif')
-    array = reprojected_ds.ReadAsArray()
+def coverage_mask(coverage):
+    height, width = coverage["shape"]
+    return np.unpackbits(coverage["mask_bits"], count=height * width).reshape(height, width).astype(bool)
 
-    height, width = array.shape
-    rgba = np.zeros((height, width, 4), dtype=np.uint8)
-    # Apply user-specified color
-    r, g, b = COLOR_MAP[color]
-    rgba[..., 0] = np.where(array == 1, r, 0)  # Red channel
-    rgba[..., 1] = np.where(array == 1, g, 0)  # Green channel
-    rgba[..., 2] = np.where(array == 1, b, 0)  # Blue channel
-    rgba[..., 3] = np.where(array == 1, 255, 0)
+def render_overlay(coverage, color, image_format="png"):
+    """Overlay image (PNG or WebP bytes) of a compute_coverage() mask in the given COLOR_MAP color"""
+    rgb = COLOR_MAP[color]
+    if image_format == "webp":
+        from PIL import Image
+        with timed("webp_encode"):
+            image = Image.fromarray(coverage_mask(coverage).astype(np.uint8), mode="P")
+            image.putpalette([0, 0, 0, *rgb])
+            image.info["transparency"] = 0
+            buf = BytesIO()
+            image.save(buf, format="WEBP", lossless=True, method=OVERLAY_WEBP_METHOD)
+        webp = buf.getvalue()
+        count_bytes("webp_encode", bytes_in=coverage["mask_bits"].nbytes, bytes_out=len(webp))
+        return webp
 
-    img = Image.fromarray(rgba, mode="RGBA")
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.read()).decode("utf-8")
-    data_url = f"data:image/png;base64,{img_base64}"
+    overlay_png = coverage.get("overlay_png")
+    if overlay_png is None:
+        with timed("png_encode"):
+            overlay_png = encode_overlay_png(coverage_mask(coverage))
+    with timed("png_recolor"):
+        return swap_palette(overlay_png.tobytes(), rgb)
+
+def compute_blockage(easting, northing, elevation_angles_deg=None, tower_m=None, agl_threshold_m=None, color='green',
+                     progressive=False, mode=None, image_format=None, tiles=False):
+    """
+    Run the blockage pipeline, returning the raw overlay image ("png", a PNG
+    or with image_format="webp" a WebP), its bounds and the 1 km coverage
+    indices.
+
+    With tiles=True no overlay image is rendered; the result is registered
+    under "coverage_id" instead and its overlay served as XYZ tiles by
+    render_coverage_tile().
+
+    With progressive=True and no full result cached yet, returns the coarse
+    result ("complete": False) and starts the full one in the background;
+    repeating the request without progressive then waits for that
+    computation instead of starting another one.
+    """
+    if elevation_angles_deg is None:
+        elevation_angles_deg = VCP12
+    if tower_m is None:
+        tower_m = DEFAULT_TOWER_M
+    if agl_threshold_m is None:
+        agl_threshold_m = DEFAULT_AGL_THRESHOLD_M
 
-    # Convert bounds to epsg:4326
-    gt = reprojected_ds.GetGeoTransform()
-    x_min = gt[0]
-    y_max = gt[3]
-    x_max = x_min + gt[1] * reprojected_ds.RasterXSize
-    y_min = y_max + gt[5] * reprojected_ds.RasterYSize
+    if mode is None:
+        mode = DEFAULT_BLOCKAGE_MODE
+    if mode not in BLOCKAGE_MODES:
+        raise ValueError(f"Unsupported blockage mode: {mode}")
+    if image_format is None:
+        image_format = DEFAULT_OVERLAY_FORMAT
+    if image_format not in OVERLAY_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
 
-    transform = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
-    west, south = transform.transform(x_min, y_min)
-    east, north = transform.transform(x_max, y_max)
+    key = blockage_cache_key(easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, mode)
+    easting, northing, elevation_angles_deg, tower_m, agl_threshold_m = key[:5]
+    compute = lambda: compute_coverage(easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, mode)
+
+    complete = True
+    if progressive:
+        coverage = blockage_cache.peek(key)
+        if coverage is None:
+            _progressive_executor.submit(_compute_in_background, key, compute)
+            coverage = blockage_cache.get(key + ("coarse", PROGRESSIVE_FACTOR), lambda: compute_coarse_coverage(
+                easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, mode
+            ))
+            complete = False
+    else:
+        coverage = blockage_cache.get(key, compute)
+
+    result = {
+        "png": b"" if tiles else render_overlay(coverage, color, image_format),
+        "image_type": OVERLAY_FORMATS[image_format],
+        "bounds": coverage["bounds"],
+        "coverage_indices": coverage["coverage_indices"],
+        "complete": complete,
+    }
+    if tiles:
+        result["coverage_id"] = coverage_registry.register(key)
+    return result
+
+def coverage_tile_source(coverage_id):
+    """
+    (coverage, complete) to cut a registered coverage's tiles from, None if
+    the id is unknown. While a progressive request's full result is still
+    computing, tiles come from its coarse result; if both have been evicted
+    the full result is recomputed.
+    """
+    key = coverage_registry.get(coverage_id)
+    if key is None:
+        return None
+    coverage = blockage_cache.peek(key)
+    if coverage is None:
+        coarse = blockage_cache.peek(key + ("coarse", PROGRESSIVE_FACTOR))
+        if coarse is not None:
+            return coarse, False
+        easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, mode = key[:6]
+        coverage = blockage_cache.get(key, lambda: compute_coverage(
+            easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, mode
+        ))
+    return coverage, True
+
+def render_coverage_tile(coverage, z, x, y, color):
+    """Palette PNG of one XYZ tile of a compute_coverage() result, b"" if the tile is empty"""
+    easting, northing, pixel_size, window = coverage["window"]
+    with timed("tile_cut"):
+        tile = cut_tile(coverage["matrix_bits"], int(window), easting, northing, pixel_size, z, x, y)
+    if tile is None or not tile.any():
+        return b""
+    with timed("tile_encode"):
+        png = encode_palette_png(tile, COLOR_MAP[color], OVERLAY_PNG_BIT_DEPTH, OVERLAY_ZLIB_LEVEL,
+                                 OVERLAY_ZLIB_STRATEGY).getvalue()
+    count_bytes("tile_encode", bytes_in=tile.size, bytes_out=len(png))
+    return png
+
+def get_blockage(easting, northing, elevation_angles_deg=None, tower_m=None, agl_threshold_m=None, color='green',
+                 progressive=False, mode=None, image_format=None, tiles=False):
+    result = compute_blockage(easting, northing, elevation_angles_deg, tower_m, agl_threshold_m, color, progressive, mode,
+                              image_format, tiles)
+
+    with timed("base64"):
+        img_base64 = base64.b64encode(result["png"]).decode("utf-8")
+        data_url = f"data:{result['image_type']};base64,{img_base64}"
+
+        coverage_indices = result["coverage_indices"]
+        coverage_indices_b64 = base64.b64encode(coverage_indices.tobytes()).decode('utf-8')
+    count_bytes("base64", bytes_in=len(result["png"]) + coverage_indices.nbytes,
+                bytes_out=len(img_base64) + len(coverage_indices_b64))
 
     response = {
         "image_url": data_url,
-        "bounds": {
-            "north": north,
-            "south": south,
-            "east": east,
-            "west": west
-        },
+        "bounds": result["bounds"],
         "coverage_indices": {
             "data": coverage_indices_b64,
             "dtype": str(coverage_indices.dtype)
-        }
+        },
+        "complete": result["complete"]
     }
+    if "coverage_id" in result:
+        response["coverage_id"] = result["coverage_id"]
 
     return response
 
+# 1 km EPSG:3857 DEM used for terrain profiles
+TERRAIN_DEM_PATH = r"C:\Users\ralaya\Documents\gis\projects\wsr88-coverage-app\backend\dem1000_epsg3857.tif"
+TERRAIN_WINDOW_SIZE = 920
+
+def get_terrain_profile(easting, northing, dem_path=TERRAIN_DEM_PATH):
+    """Terrain profiles (one per azimuth) around an EPSG:3857 point, base64-encoded for the frontend"""
+    window = get_dem_pool(dem_path).window(easting=easting, northing=northing, window_size=TERRAIN_WINDOW_SIZE, flip=False) # we are in 3857, no need to flip
+    profile_1d = get_1d_profile(window=window, easting=easting, northing=northing)
+    profile_1d_b64 = base64.b64encode(profile_1d.tobytes()).decode('utf-8')
+    return {
+        "terrain": profile_1d_b64,
+        "dtype": str(profile_1d.dtype),
+        "width": N_DISTANCES,
+    }
+
 if __name__ == "__main__":
     easting, northing = 649531.417877711355686, 2644666.859246487729251
     coverage = get_blockage(easting, northing)
\ No newline at end of file
@@ -1,6 +1,9 @@
 import io
 import struct
 import zlib
+from functools import lru_cache
+
+import numpy as np
 
 TILE_BASE_PATH = r"C:\Users\ralaya\Documents\gis\projects\wsr88-coverage-app\frontend\public\data\nexrad_coverages"
 
@@ -11,6 +14,12 @@ COLOR_MAP = {
     "gray":  (111, 111, 111),
 }
 
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Palette tiles (see convert_tiles_to_palette.py) store index 0 = transparent,
+# index 1 = covered. This is the color written into PLTE before any recolor.
+PALETTE_PLACEHOLDER_RGB = (220, 0, 0)
+
 def read_chunk(f):
     length_data = f.read(4)
     if not length_data:
@@ -67,14 +76,11 @@ def apply_png_filter_reverse(filter_type, current_row, previous_row, bytes_per_p
     
     return current_row
 
-def recolor_png(input_path, target_color_str):
-    if target_color_str not in COLOR_MAP:
-        raise ValueError(f"Unsupported color: {target_color_str}")
-    target_rgb = COLOR_MAP[target_color_str]
-
+def read_png(input_path):
+    """Split a PNG file into its IHDR payload, concatenated IDAT data and remaining chunks"""
     with open(input_path, 'rb') as f:
         signature = f.read(8)
-        if signature != b'\x89PNG\r\n\x1a\n':
+        if signature != PNG_SIGNATURE:
             raise ValueError("Not a valid PNG file")
 
         chunks = []
@@ -92,13 +98,156 @@ def recolor_png(input_path, target_color_str):
             else:
                 chunks.append((chunk_type, data))
 
+    return ihdr, idat_data, chunks
+
+def write_png(ihdr, idat_data, chunks):
+    """Assemble a PNG in a memory buffer (IHDR, IDAT, then any ancillary chunks)"""
+    buffer = io.BytesIO()
+    buffer.write(PNG_SIGNATURE)
+    write_chunk(buffer, b'IHDR', ihdr)
+    write_chunk(buffer, b'IDAT', idat_data)
+    for chunk_type, data in chunks:
+        if chunk_type != b'IDAT' and chunk_type != b'IEND':
+            write_chunk(buffer, chunk_type, data)
+    write_chunk(buffer, b'IEND', b'')
+    buffer.seek(0)
+    return buffer
+
+def unfilter_scanlines(decompressed, width, height, bytes_per_pixel=4):
+    """
+    Reverse PNG filtering for a whole image at once.
+
+    Rows that only use None/Sub/Up are decoded row by row (Sub is a running
+    sum over pixels, Up is one add). Average and Paeth depend on the pixel to
+    the left *and* the row above, so when they are present the image is
+    skewed so that every anti-diagonal becomes a contiguous slice and decoded
+    one diagonal at a time; all pixels on a diagonal only depend on earlier ones.
+
+    Returns a (height, width * bytes_per_pixel) uint8 array.
+    """
+    stride = width * bytes_per_pixel
+    raw = np.frombuffer(decompressed, dtype=np.uint8, count=height * (stride + 1))
+    raw = raw.reshape(height, stride + 1)
+    filters = raw[:, 0]
+    data = raw[:, 1:]
+
+    if not np.any((filters == 3) | (filters == 4)):
+        out = np.empty((height, stride), dtype=np.uint8)
+        previous_row = np.zeros(stride, dtype=np.uint8)
+        for y in range(height):
+            filter_type = filters[y]
+            if filter_type == 1:  # Sub
+                row = np.cumsum(data[y].reshape(width, bytes_per_pixel), axis=0, dtype=np.uint8).reshape(stride)
+            elif filter_type == 2:  # Up
+                row = data[y] + previous_row
+            else:  # None (unknown filter types are passed through, as before)
+                row = data[y]
+            out[y] = row
+            previous_row = out[y]
+        return out
+
+    # Skewed layout: skewed[y + x + 2, y + 1] holds pixel (y, x), so every
+    # anti-diagonal is one contiguous slice. The extra leading row/columns are
+    # zero padding, which is exactly what the filters expect for neighbours
+    # outside the image.
+    n_diag = height + width - 1
+    ys = np.arange(height)[:, None]
+    diags = ys + np.arange(width)[None, :] + 2
+    raw_skewed = np.zeros((n_diag + 2, height, bytes_per_pixel), dtype=np.int16)
+    raw_skewed[diags, ys] = data.reshape(height, width, bytes_per_pixel)
+    skewed = np.zeros((n_diag + 2, height + 1, bytes_per_pixel), dtype=np.int16)
+
+    # Per-filter row masks, and running counts so each diagonal can cheaply
+    # skip the predictors none of its rows use
+    row_masks = {k: (filters == k)[:, None] for k in (1, 2, 3, 4)}
+    row_counts = {k: np.concatenate(([0], np.cumsum(filters == k))) for k in (1, 2, 3, 4)}
+
+    for d in range(n_diag):
+        y0 = max(0, d - width + 1)
+        y1 = min(height, d + 1)
+        col = d + 2
+        a = skewed[col - 1, y0 + 1:y1 + 1]  # left
+        b = skewed[col - 1, y0:y1]          # up
+        c = skewed[col - 2, y0:y1]          # upper left
+
+        decoded = raw_skewed[col, y0:y1].copy()
+        for filter_type in (1, 2, 3, 4):
+            n_rows = row_counts[filter_type][y1] - row_counts[filter_type][y0]
+            if n_rows == 0:
+                continue
+            if filter_type == 1:  # Sub
+                predictor = a
+            elif filter_type == 2:  # Up
+                predictor = b
+            elif filter_type == 3:  # Average
+                predictor = (a + b) >> 1
+            else:  # Paeth
+                bc = b - c
+                ac = a - c
+                pa = np.abs(bc)
+                pb = np.abs(ac)
+                pc = np.abs(ac + bc)
+                predictor = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+            if n_rows == y1 - y0:
+                decoded += predictor
+            else:
+                decoded += predictor * row_masks[filter_type][y0:y1]
+
+        skewed[col, y0 + 1:y1 + 1] = decoded & 0xFF
+
+    pixels = skewed[diags, ys + 1].astype(np.uint8)
+    return pixels.reshape(height, stride)
+
+def read_coverage_mask(input_path):
+    """Decode an RGBA coverage tile into a boolean (height, width) mask of covered (red == 220) pixels"""
+    ihdr, idat_data, _ = read_png(input_path)
+    width, height, bit_depth, color_type, compression, filter_method, interlace = struct.unpack(">IIBBBBB", ihdr) # type: ignore
+
+    if bit_depth != 8 or color_type != 6:
+        raise NotImplementedError("Only 32-bit RGBA PNGs are supported (bit depth 8, color type 6)")
+
+    decompressed = zlib.decompress(idat_data)
+    pixels = unfilter_scanlines(decompressed, width, height, bytes_per_pixel=4).reshape(height, width, 4)
+    return pixels[..., 0] == 220
+
+def recolor_png(input_path, target_color_str):
+    if target_color_str not in COLOR_MAP:
+        raise ValueError(f"Unsupported color: {target_color_str}")
+    target_rgb = COLOR_MAP[target_color_str]
+
+    ihdr, idat_data, chunks = read_png(input_path)
+
+    width, height, bit_depth, color_type, compression, filter_method, interlace = struct.unpack(">IIBBBBB", ihdr) # type: ignore
+
+    if bit_depth != 8 or color_type != 6:
+        raise NotImplementedError("Only 32-bit RGBA PNGs are supported (bit depth 8, color type 6)")
+
+    decompressed = zlib.decompress(idat_data)
+    pixels = unfilter_scanlines(decompressed, width, height, bytes_per_pixel=4).reshape(height, width, 4)
+
+    # Covered pixels (red == 220) get the target color, everything else is transparent.
+    # Column 0 of every output row is the filter byte, always 0 (None).
+    out = np.zeros((height, 1 + width * 4), dtype=np.uint8)
+    out_pixels = out[:, 1:].reshape(height, width, 4)
+    out_pixels[pixels[..., 0] == 220] = (*target_rgb, 255)
+
+    compressed = zlib.compress(out.tobytes())
+    return write_png(ihdr, compressed, chunks)
+
+def recolor_png_legacy(input_path, target_color_str):
+    """Original pure-Python implementation, kept as the reference for bench_recolor.py"""
+    if target_color_str not in COLOR_MAP:
+        raise ValueError(f"Unsupported color: {target_color_str}")
+    target_rgb = COLOR_MAP[target_color_str]
+
+    ihdr, idat_data, chunks = read_png(input_path)
+
     width, height, bit_depth, color_type, compression, filter_method, interlace = struct.unpack(">IIBBBBB", ihdr) # type: ignore
 
     if bit_depth != 8 or color_type != 6:
         raise NotImplementedError("Only 32-bit RGBA PNGs are supported (bit depth 8, color type 6)")
 
     decompressed = zlib.decompress(idat_data)
-    print(len(decompressed) / 4.0)
 
     stride = width * 4
     new_data = bytearray()
@@ -144,18 +293,88 @@ def recolor_png(input_path, target_color_str):
         previous_row = actual_pixels
         i += stride
 
-    print(i / 4)
-
     compressed = zlib.compress(bytes(new_data))
 
-    # Write PNG to memory buffer
+    return write_png(ihdr, compressed, chunks)
+
+
+def encode_palette_png(mask, rgb, bit_depth=1, level=9, strategy=zlib.Z_DEFAULT_STRATEGY):
+    """
+    Encode a 2D 0/1 mask as a palette PNG: index 0 is fully transparent,
+    index 1 is `rgb` at full opacity. bit_depth is 1 (packed) or 8.
+    """
+    if bit_depth not in (1, 8):
+        raise ValueError(f"Unsupported palette bit depth: {bit_depth}")
+    mask = np.asarray(mask)
+    height, width = mask.shape
+
+    if bit_depth == 1:
+        rows = np.packbits(mask != 0, axis=1)  # MSB first, as PNG expects
+    else:
+        rows = (mask != 0).astype(np.uint8)
+    scanlines = np.zeros((height, 1 + rows.shape[1]), dtype=np.uint8)  # filter byte 0 (None)
+    scanlines[:, 1:] = rows
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+    idat_data = compressor.compress(scanlines.tobytes()) + compressor.flush()
+
     buffer = io.BytesIO()
-    buffer.write(b'\x89PNG\r\n\x1a\n')
-    write_chunk(buffer, b'IHDR', ihdr)
-    write_chunk(buffer, b'IDAT', compressed)
-    for chunk_type, data in chunks:
-        if chunk_type != b'IDAT' and chunk_type != b'IEND':
-            write_chunk(buffer, chunk_type, data)
+    buffer.write(PNG_SIGNATURE)
+    write_chunk(buffer, b'IHDR', struct.pack(">IIBBBBB", width, height, bit_depth, 3, 0, 0, 0))
+    buffer.write(palette_chunks(tuple(rgb)))
+    write_chunk(buffer, b'IDAT', idat_data)
     write_chunk(buffer, b'IEND', b'')
     buffer.seek(0)
-    return buffer
\ No newline at end of file
+    return buffer
+
+@lru_cache(maxsize=None)
+def palette_chunks(rgb):
+    """Serialized PLTE + tRNS chunks for a two-entry (transparent, rgb) palette"""
+    buffer = io.BytesIO()
+    write_chunk(buffer, b'PLTE', bytes((0, 0, 0, *rgb)))
+    write_chunk(buffer, b'tRNS', b'\x00\xff')
+    return buffer.getvalue()
+
+def recolor_palette_png(input_path, target_color_str):
+    """
+    Recolor a palette tile by swapping its PLTE/tRNS chunks. Every other chunk,
+    IDAT included, is copied through byte for byte, so no pixel is decoded.
+    """
+    if target_color_str not in COLOR_MAP:
+        raise ValueError(f"Unsupported color: {target_color_str}")
+
+    with open(input_path, 'rb') as f:
+        png = f.read()
+    return io.BytesIO(swap_palette(png, COLOR_MAP[target_color_str]))
+
+def swap_palette(png, rgb):
+    """Bytes of a two-entry palette PNG with its PLTE/tRNS replaced by palette_chunks(rgb)"""
+    if png[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a valid PNG file")
+
+    parts = [PNG_SIGNATURE]
+    view = memoryview(png)
+    pos = 8
+    while pos + 8 <= len(png):
+        length = struct.unpack_from(">I", png, pos)[0]
+        chunk_type = png[pos + 4:pos + 8]
+        end = pos + 12 + length
+        if chunk_type == b'PLTE':
+            parts.append(palette_chunks(tuple(rgb)))
+        elif chunk_type != b'tRNS':
+            parts.append(view[pos:end])
+        pos = end
+    return b"".join(parts)
+
+def png_color_type(input_path):
+    with open(input_path, 'rb') as f:
+        header = f.read(26)  # signature + IHDR length/type + width, height, bit depth, color type
+    if header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        raise ValueError("Not a valid PNG file")
+    return header[25]
+
+def recolor_tile(input_path, target_color_str):
+    """Recolor a coverage tile, using the PLTE swap for palette tiles and a full re-encode otherwise"""
+    if png_color_type(input_path) == 3:
+        return recolor_palette_png(input_path, target_color_str)
+    return recolor_png(input_path, target_color_str)
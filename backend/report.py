@@ -0,0 +1,113 @@
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+# Basin coverage reports on the national 1 km grid (5221 columns, the index
+# space of coverage_indices_1km). All inputs are plain .npy files, written by
+# build_report_data.py and memory-mapped here:
+#
+#   REPORT_DATA_DIR/population.npy            uint16 people per 1 km cell
+#   REPORT_DATA_DIR/coverage_<threshold>.npy  uint8, 1 where existing NEXRAD covers the cell
+#   REPORT_DATA_DIR/basins/<usgs_id>.npy      sorted uint32 cell indices of the basin
+
+REPORT_DATA_DIR = "report_data"
+REPORT_THRESHOLDS = ("3k_ft", "6k_ft", "10k_ft")
+BASIN_CACHE_SIZE = 256
+
+class ReportData:
+    def __init__(self, data_dir=REPORT_DATA_DIR):
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._arrays = {}
+        self._basin = lru_cache(maxsize=BASIN_CACHE_SIZE)(self._load_basin)
+
+    def _array(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            with self._lock:
+                array = self._arrays.get(name)
+                if array is None:
+                    array = np.load(os.path.join(self.data_dir, f"{name}.npy"), mmap_mode="r")
+                    self._arrays[name] = array
+        return array
+
+    def population(self):
+        return self._array("population")
+
+    def n_cells(self):
+        """Number of cells in the national grid, one past the largest valid coverage index"""
+        return self.population().size
+
+    def nexrad_coverage(self, threshold):
+        if threshold not in REPORT_THRESHOLDS:
+            raise ValueError(f"Unsupported threshold: {threshold}")
+        return self._array(f"coverage_{threshold}")
+
+    def basin(self, basin_id):
+        return self._basin(str(basin_id))
+
+    def _load_basin(self, basin_id):
+        if os.path.basename(basin_id) != basin_id:
+            raise ValueError(f"Invalid basin id: {basin_id}")
+        path = os.path.join(self.data_dir, "basins", f"{basin_id}.npy")
+        if not os.path.exists(path):
+            raise KeyError(basin_id)
+        return np.load(path, mmap_mode="r")
+
+def sorted_contains(haystack, needles):
+    """Boolean mask of which needles occur in the sorted array haystack (vectorized binary search)"""
+    if haystack.size == 0:
+        return np.zeros(needles.shape, dtype=bool)
+    pos = np.searchsorted(haystack, needles)
+    pos[pos == haystack.size] = haystack.size - 1
+    return haystack[pos] == needles
+
+def basin_report(basin_indices, population, nexrad_coverage, custom_coverages):
+    """
+    Area (1 km cells) and population of a basin covered by existing NEXRAD, by
+    the custom radars (cells NEXRAD doesn't already cover) and by neither.
+    Same numbers as reporter.js used to compute in the browser.
+    """
+    basin_indices = np.asarray(basin_indices)
+    population_at = population[basin_indices].astype(np.int64)
+    by_nexrad = nexrad_coverage[basin_indices] == 1
+
+    # Each radar only needs to check the cells nothing before it has covered
+    uncovered = np.flatnonzero(~by_nexrad)
+    by_custom = np.zeros(basin_indices.shape, dtype=bool)
+    for coverage_indices in custom_coverages:
+        if uncovered.size == 0:
+            break
+        hit = sorted_contains(np.asarray(coverage_indices), basin_indices[uncovered])
+        by_custom[uncovered[hit]] = True
+        uncovered = uncovered[~hit]
+
+    total_pixels = int(basin_indices.size)
+    total_population = int(population_at.sum())
+    area = {
+        "coveredByNexrad": int(by_nexrad.sum()),
+        "coveredByCustom": int(by_custom.sum()),
+    }
+    people = {
+        "coveredByNexrad": int(population_at[by_nexrad].sum()),
+        "coveredByCustom": int(population_at[by_custom].sum()),
+    }
+    area["notCovered"] = total_pixels - area["coveredByNexrad"] - area["coveredByCustom"]
+    area["total"] = total_pixels
+    people["notCovered"] = total_population - people["coveredByNexrad"] - people["coveredByCustom"]
+    people["total"] = total_population
+    return {"area": area, "population": people}
+
+report_data = ReportData(REPORT_DATA_DIR)
+
+def generate_report(basin_id, threshold="3k_ft", custom_coverages=()):
+    """Coverage report for a basin, custom_coverages being the sorted 1 km coverage indices of each custom radar"""
+    report = basin_report(
+        report_data.basin(basin_id),
+        report_data.population(),
+        report_data.nexrad_coverage(threshold),
+        custom_coverages,
+    )
+    return {"basinId": basin_id, **report}
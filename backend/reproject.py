@@ -0,0 +1,93 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from calculate_blockage.projections import srs_wkt, transformer
+from calculate_blockage.read_dem import load_gdal
+
+# Reprojection of blockage masks without any /vsimem files, so concurrent
+# requests never share GDAL state.
+#
+# The 5070 -> 3857 nearest-neighbour warp only depends on where the window is,
+# not on the mask, so it is done once per location on an "index" raster whose
+# pixels hold their own (1-based) position. Warping that raster gives, for
+# every 3857 pixel, the 5070 pixel it samples; any mask for the same location
+# is then reprojected with one gather.
+
+# two entries (coarse and full resolution) per recently used site
+WARP_INDEX_CACHE_SIZE = 8
+
+WarpIndex = namedtuple("WarpIndex", ["index", "geotransform", "bounds"])
+
+def window_geotransform(easting, northing, window_size, pixel_size):
+    """Geotransform of the north-up EPSG:5070 blockage window centered on (easting, northing)"""
+    return [
+        easting - (window_size * pixel_size) // 2,  # top-left x
+        pixel_size,                                 # pixel width
+        0,
+        northing + (window_size * pixel_size) // 2, # top-left y
+        0,
+        -pixel_size                                  # pixel height (negative for north-up)
+    ]
+
+@lru_cache(maxsize=WARP_INDEX_CACHE_SIZE)
+def warp_index(easting, northing, window_size, pixel_size):
+    """Nearest-neighbour 5070 -> 3857 index map for one window location, plus the 3857 geotransform and 4326 bounds"""
+    gdal = load_gdal()
+    src_ds = gdal.GetDriverByName("MEM").Create('', window_size, window_size, 1, gdal.GDT_UInt32)
+    src_ds.SetGeoTransform(window_geotransform(easting, northing, window_size, pixel_size))
+    src_ds.SetProjection(srs_wkt(5070))
+    positions = np.arange(1, window_size * window_size + 1, dtype=np.uint32).reshape(window_size, window_size)
+    src_ds.GetRasterBand(1).WriteArray(positions)
+
+    dst_ds = gdal.Warp(
+        '',
+        src_ds,
+        format='MEM',
+        dstSRS='EPSG:3857',
+        resampleAlg=gdal.GRA_NearestNeighbour
+    )
+    index = dst_ds.GetRasterBand(1).ReadAsArray()
+    index.flags.writeable = False
+
+    # Convert bounds to epsg:4326
+    gt = dst_ds.GetGeoTransform()
+    x_min = gt[0]
+    y_max = gt[3]
+    x_max = x_min + gt[1] * dst_ds.RasterXSize
+    y_min = y_max + gt[5] * dst_ds.RasterYSize
+
+    transform = transformer("EPSG:3857", "EPSG:4326")
+    west, south = transform.transform(x_min, y_min)
+    east, north = transform.transform(x_max, y_max)
+
+    bounds = {"north": north, "south": south, "east": east, "west": west}
+    return WarpIndex(index, gt, bounds)
+
+def warp_to_3857(mask, easting, northing, pixel_size):
+    """Reproject a square EPSG:5070 mask window to EPSG:3857 (nearest neighbour, 0 outside the window)"""
+    warp = warp_index(easting, northing, mask.shape[0], pixel_size)
+    # Position 0 is "no source pixel", which maps to the 0 prepended here
+    flat = np.concatenate((np.zeros(1, dtype=mask.dtype), mask.ravel()))
+    return flat[warp.index], warp
+
+def resample_nearest(mask, pixel_size, target_pixel_size):
+    """
+    Nearest-neighbour resample of a north-up window to a coarser pixel size, as
+    gdal.Warp(xRes=yRes=target_pixel_size) does: each target pixel takes the
+    source pixel under its center. When the target size is a whole multiple
+    of the source size that is a strided view.
+    """
+    factor = target_pixel_size / pixel_size
+    height, width = mask.shape
+    n_rows = int(height / factor + 0.5)
+    n_cols = int(width / factor + 0.5)
+    if factor == int(factor):
+        factor = int(factor)
+        resampled = mask[factor // 2::factor, factor // 2::factor]
+        if resampled.shape == (n_rows, n_cols):
+            return resampled
+    rows = np.minimum(((np.arange(n_rows) + 0.5) * factor).astype(np.intp), height - 1)
+    cols = np.minimum(((np.arange(n_cols) + 0.5) * factor).astype(np.intp), width - 1)
+    return mask[rows[:, None], cols[None, :]]
@@ -0,0 +1,191 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+class BlockageCache:
+    """
+    Content-addressed LRU cache for color-independent blockage results, with
+    request coalescing: while a key is being computed, identical requests wait
+    for that computation instead of starting their own.
+
+    Results are dicts of numpy arrays and JSON-able values. They are kept in
+    memory up to `max_bytes`, and optionally in `disk_dir` up to
+    `disk_max_bytes` as .npz files named by the key's hash.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=2 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (size, result)
+        self._bytes = 0
+        self._in_flight = {}  # key -> Future
+        self._disk_entries = OrderedDict()  # path -> size
+        self._disk_bytes = 0
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "disk_evictions": 0}
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            files = []
+            for name in os.listdir(disk_dir):
+                if name.endswith(".npz"):
+                    st = os.stat(os.path.join(disk_dir, name))
+                    files.append((st.st_atime, os.path.join(disk_dir, name), st.st_size))
+            for _, path, size in sorted(files):
+                self._disk_entries[path] = size
+                self._disk_bytes += size
+
+    def get(self, key, compute):
+        """Cached result for `key`, calling `compute()` at most once across concurrent callers"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[1]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self._counters["coalesced"] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._disk_get(key)
+            if result is None:
+                result = compute()
+                self._disk_put(key, result)
+                counter = "misses"
+            else:
+                counter = "disk_hits"
+            self._put(key, result)
+            with self._lock:
+                self._counters[counter] += 1
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def peek(self, key):
+        """Result for `key` if it is in memory, without computing or waiting for it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": (self._counters["hits"] + self._counters["disk_hits"]) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "in_flight": len(self._in_flight),
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put(self, key, result):
+        size = result_nbytes(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[0]
+            self._entries[key] = (size, result)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self._counters["evictions"] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".npz") # type: ignore
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with np.load(path) as npz:
+                result = {name: npz[name] for name in npz.files if name != "__json__"}
+                result.update(json.loads(npz["__json__"].tobytes()))
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if path in self._disk_entries:
+                self._disk_entries.move_to_end(path)
+        return result
+
+    def _disk_put(self, key, result):
+        if not self.disk_dir:
+            return
+        arrays = {name: value for name, value in result.items() if isinstance(value, np.ndarray)}
+        extra = {name: value for name, value in result.items() if not isinstance(value, np.ndarray)}
+        buffer = io.BytesIO()
+        np.savez(buffer, __json__=np.frombuffer(json.dumps(extra).encode(), dtype=np.uint8), **arrays)
+        data = buffer.getvalue()
+        if len(data) > self.disk_max_bytes:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(path, 0)
+            self._disk_entries[path] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.disk_max_bytes:
+                oldest, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                self._counters["disk_evictions"] += 1
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(oldest)
+            except FileNotFoundError:
+                pass
+
+def result_nbytes(result):
+    return sum(value.nbytes for value in result.values() if isinstance(value, np.ndarray)) + 256
+
+def file_version(*paths):
+    """Version string for a set of input files (missing files count as absent), used in cache keys"""
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        except FileNotFoundError:
+            parts.append(f"{path}:-")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
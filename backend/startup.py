@@ -0,0 +1,71 @@
+import time
+
+from calculate_blockage import (
+    beam_height_table, get_dem_pool, load_gdal, polar_index_maps, range_bin_grid, within_range_mask
+)
+from calculate_blockage.blockage import VIEWSHED_AZIMUTHS
+from calculate_blockage.constants import DEM_PATH, MAX_RANGE_M, VCP12, dem_pixel_size, window_size
+from calculate_blockage.projections import geod, srs_wkt, transformer
+from processor import PROGRESSIVE_FACTOR, TERRAIN_DEM_PATH, site_angles
+from recolor import COLOR_MAP, palette_chunks
+
+# Explicit warm-up of what the request paths otherwise load on first use, for
+# servers that load the app once and fork workers from it:
+#
+#   - uWSGI with lazy-apps off (the default): wsgi.py imports the app and
+#     calls warm_up(), and registers after_fork with uwsgidecorators.postfork
+#   - gunicorn: preload_app = True with the same wsgi.py, and a post_fork
+#     hook calling after_fork()
+#
+# The workers then share the imported modules, the memory-mapped DEM and the
+# lookup tables copy-on-write. State that must not cross a fork is left to
+# after_fork(): pyproj Transformers hold a PROJ context with an open proj.db
+# handle, and GDAL-backed DemPools open their handles in each worker anyway.
+
+WARM_UP_PROJECTIONS = (("EPSG:3857", "EPSG:4326"), ("EPSG:4326", "EPSG:3857"), ("EPSG:3857", "EPSG:5070"))
+
+def warm_up(dem_paths=(DEM_PATH, TERRAIN_DEM_PATH), viewshed=True):
+    """Load everything the first request would otherwise pay for, returns {step: seconds}"""
+    def imports():
+        load_gdal()
+        import pyproj
+        from PIL import Image
+        Image.init()  # registers the WebP plugin
+
+    def dems():
+        for dem_path in dem_paths:
+            get_dem_pool(dem_path)
+
+    def beam_tables():
+        beam_height_table(site_angles(VCP12), MAX_RANGE_M)
+
+    def range_tables():
+        # full resolution and the coarse preview of progressive requests
+        for factor in (1, PROGRESSIVE_FACTOR):
+            grid_size, pixel_size = window_size // factor, dem_pixel_size * factor
+            range_bin_grid(grid_size, pixel_size, MAX_RANGE_M)
+            within_range_mask(grid_size, pixel_size, MAX_RANGE_M)
+            if viewshed:
+                polar_index_maps(grid_size, pixel_size, MAX_RANGE_M, VIEWSHED_AZIMUTHS)
+
+    def projections():
+        geod()
+        srs_wkt(5070)
+
+    def palettes():
+        for rgb in COLOR_MAP.values():
+            palette_chunks(rgb)
+
+    timings = {}
+    for step in (imports, dems, beam_tables, range_tables, projections, palettes):
+        start = time.perf_counter()
+        step()
+        timings[step.__name__] = time.perf_counter() - start
+    return timings
+
+def after_fork():
+    """Per-worker setup, run in each worker right after it is forked"""
+    # Drop any Transformer inherited from the parent and build this process's own
+    transformer.cache_clear()
+    for src_crs, dst_crs in WARM_UP_PROJECTIONS:
+        transformer(src_crs, dst_crs)
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+class TileCache:
+    """
+    Bounded LRU cache for rendered tiles.
+
+    Entries are keyed by a tuple such as (threshold, z, x, y, color) and tagged
+    with the source file's mtime, so a tile is re-rendered as soon as its source
+    PNG changes. The in-memory tier holds at most `max_bytes` of tile data; the
+    optional on-disk tier under `disk_dir` holds at most `disk_max_bytes`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (source mtime_ns, data)
+        self._bytes = 0
+        self._disk_entries = OrderedDict()  # disk path -> size
+        self._disk_bytes = 0
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0, "stale": 0}
+
+        if disk_dir:
+            self._scan_disk()
+
+    def get(self, key, source_path, source_mtime_ns, render):
+        """Return cached tile bytes for `key`, calling `render()` on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == source_mtime_ns:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return entry[1]
+                self._drop(key)
+                self._counters["stale"] += 1
+
+        data = self._disk_get(key, source_mtime_ns)
+        if data is None:
+            data = render()
+            self._disk_put(key, data)
+            with self._lock:
+                self._counters["misses"] += 1
+        else:
+            with self._lock:
+                self._counters["disk_hits"] += 1
+
+        self._put(key, source_mtime_ns, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": (self._counters["hits"] + self._counters["disk_hits"]) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # In-memory tier
+
+    def _put(self, key, source_mtime_ns, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (source_mtime_ns, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._counters["evictions"] += 1
+
+    def _drop(self, key):
+        _, data = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    # On-disk tier
+
+    def _disk_path(self, key):
+        # Key parts come from the request, so they are hashed rather than used as path components
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, digest[:2], f"{digest[2:]}.png") # type: ignore
+
+    def _scan_disk(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.disk_dir): # type: ignore
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.endswith(".png"):
+                    st = os.stat(path)
+                    files.append((st.st_atime, path, st.st_size))
+        for _, path, size in sorted(files):
+            self._disk_entries[path] = size
+            self._disk_bytes += size
+
+    def _disk_get(self, key, source_mtime_ns):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            st = os.stat(path)
+            # A disk entry is only valid if it was written after the source last changed
+            if st.st_mtime_ns < source_mtime_ns:
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if path in self._disk_entries:
+                self._disk_entries.move_to_end(path)
+        return data
+
+    def _disk_put(self, key, data):
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(path, 0)
+            self._disk_entries[path] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.disk_max_bytes:
+                oldest, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                self._counters["disk_evictions"] += 1
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(oldest)
+            except FileNotFoundError:
+                pass
+
+def tile_etag(key, source_stat):
+    """Strong ETag for a rendered tile: rendering is deterministic, so key + source version identify the bytes"""
+    return version_etag(key, f"{source_stat.st_mtime_ns}:{source_stat.st_size}")
+
+def version_etag(key, version):
+    return hashlib.sha1(f"{key}:{version}".encode()).hexdigest()
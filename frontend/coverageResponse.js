@@ -0,0 +1,83 @@
+// Decoder for the binary /calculate_blockage response (see backend/coverage_format.py).
+//
+// Layout (little-endian uint32): "NXCV" | version | header length | header JSON | overlay PNG | coverage
+// Coverage is a list of LEB128 varints, alternating (gap since the end of the previous run, run length).
+const COVERAGE_MIMETYPE = 'application/vnd.nexrad-coverage';
+
+function decodeCoverageResponse(buffer) {
+    const bytes = new Uint8Array(buffer);
+    if (String.fromCharCode(bytes[0], bytes[1], bytes[2], bytes[3]) !== 'NXCV') {
+        throw new Error('Not a coverage response');
+    }
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(new TextDecoder().decode(bytes.subarray(12, 12 + headerLength)));
+
+    let pos = 12 + headerLength;
+    // empty when the overlay is served as tiles (coverage_id)
+    const png = header.png_length ? new Blob([bytes.subarray(pos, pos + header.png_length)], { type: header.image_type || 'image/png' }) : null;
+    pos += header.png_length;
+
+    const runs = bytes.subarray(pos, pos + header.coverage.length);
+    const coverageIndices = new Uint32Array(header.coverage.count);
+    let i = 0;
+    let n = 0;
+    let cursor = 0;
+    let isGap = true;
+    while (i < runs.length) {
+        let value = 0;
+        let scale = 1;
+        let byte;
+        do {
+            byte = runs[i++];
+            value += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+
+        if (isGap) {
+            cursor += value;
+        } else {
+            for (let k = 0; k < value; k++) coverageIndices[n++] = cursor++;
+        }
+        isGap = !isGap;
+    }
+
+    return {
+        bounds: header.bounds,
+        imageUrl: png ? URL.createObjectURL(png) : null,
+        coverageIndices,
+        complete: header.complete !== false,
+        coverageId: header.coverage_id || null,
+    };
+}
+
+// Inverse of the coverage decoding above: sorted Uint32Array -> base64 varint runs,
+// the "runs-varint" encoding accepted by the backend (e.g. /report custom_coverages).
+function encodeCoverageRuns(indices) {
+    const bytes = [];
+    const pushVarint = (value) => {
+        while (value >= 0x80) {
+            bytes.push((value % 128) | 0x80);
+            value = Math.floor(value / 128);
+        }
+        bytes.push(value);
+    };
+
+    let previousEnd = 0;
+    let i = 0;
+    while (i < indices.length) {
+        const start = indices[i];
+        let length = 1;
+        while (i + length < indices.length && indices[i + length] === start + length) length++;
+        pushVarint(start - previousEnd);
+        pushVarint(length);
+        previousEnd = start + length;
+        i += length;
+    }
+
+    let binary = '';
+    for (let k = 0; k < bytes.length; k += 0x8000) {
+        binary += String.fromCharCode.apply(null, bytes.slice(k, k + 0x8000));
+    }
+    return btoa(binary);
+}
@@ -0,0 +1,70 @@
+// Custom radar coverage drawn from /tiles?coverage_id=... (see backend/coverage_tiles.py),
+// with the same setMap/getMap/setOpacity interface as the single-image customOverlay.
+class CoverageTileOverlay {
+    constructor(coverageId, map, complete = true) {
+        this.coverageId = coverageId;
+        this.complete = complete;
+        this.opacity = 1.0;
+        this.map = null;
+        this.layer = this.makeLayer();
+        if (map) this.setMap(map);
+    }
+
+    makeLayer() {
+        return new google.maps.ImageMapType({
+            getTileUrl: (coord, zoom) => {
+                const params = new URLSearchParams({
+                    coverage_id: this.coverageId,
+                    z: zoom,
+                    x: coord.x,
+                    y: coord.y,
+                    color: window.overlay_color,
+                    // coarse and full tiles have different URLs so the browser doesn't reuse coarse ones
+                    v: this.complete ? 'full' : 'coarse',
+                });
+                return `${config.APP_API}/tiles?${params.toString()}`;
+            },
+            tileSize: new google.maps.Size(256, 256),
+            maxZoom: 14,
+            minZoom: 4,
+            name: `coverage-${this.coverageId}`,
+            opacity: this.opacity,
+        });
+    }
+
+    setMap(map) {
+        if (map === this.map) return;
+        if (this.map) {
+            const overlayMapTypes = this.map.overlayMapTypes;
+            for (let i = overlayMapTypes.getLength() - 1; i >= 0; i--) {
+                if (overlayMapTypes.getAt(i) === this.layer) {
+                    overlayMapTypes.removeAt(i);
+                    break;
+                }
+            }
+        }
+        this.map = map;
+        if (map) map.overlayMapTypes.push(this.layer);
+    }
+
+    getMap() {
+        return this.map;
+    }
+
+    setOpacity(opacity) {
+        this.opacity = opacity;
+        this.layer.setOpacity(opacity);
+    }
+
+    // Switch to another coverage (or to the full-resolution result of the same one) and reload the tiles
+    setCoverage(coverageId, complete = true) {
+        this.coverageId = coverageId;
+        this.complete = complete;
+        const map = this.map;
+        this.setMap(null);
+        this.layer = this.makeLayer();
+        this.setMap(map);
+    }
+}
+
+window.CoverageTileOverlay = CoverageTileOverlay;
@@ -80,6 +80,7 @@ class RadarLayer {
         const newRadarId = id !== null ? id: ++this.currentRadarId;
 
         this.coverageIndicesMap.set(newRadarId, coverageIndices);
+        this.applyRefinedCoverage(newRadarId, result);
         triggerReportGeneration();
         
         const newRadar = {
@@ -129,6 +130,7 @@ class RadarLayer {
         }
 
         this.coverageIndicesMap.set(id, coverageIndices);
+        this.applyRefinedCoverage(id, result);
         triggerReportGeneration();
 
         radarToUpdate.overlay = overlay;
@@ -159,6 +161,7 @@ class RadarLayer {
                 
                 // Store coverageIndices for this radar
                 this.coverageIndicesMap.set(radarToUpdate.id, coverageIndices);
+                this.applyRefinedCoverage(radarToUpdate.id, result);
                 triggerReportGeneration();
                 
                 return true;
@@ -218,31 +221,71 @@ class RadarLayer {
             color: window.overlay_color
         };
 
-        let data;
+        let result;
         try {
             showSpinner();
-            const res = await fetch(`${config.APP_API}/calculate_blockage`, {
-                method: 'POST', headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(body)
-            });
-            data = await res.json();
+            result = await this.requestCoverage({ ...body, progressive: true, tiles: true });
         } catch (error) {
             showError("Request failed: ", error);
             hideSpinner();
             return null;
         }
 
-        const binaryCoverageIndices = Uint8Array.from(atob(data.coverage_indices.data), c => c.charCodeAt(0));
-        const coverageIndices = new Uint32Array(binaryCoverageIndices.buffer);
-
-        const sw = new google.maps.LatLng(data.bounds.south, data.bounds.west);
-        const ne = new google.maps.LatLng(data.bounds.north, data.bounds.east);
-        const bounds = new google.maps.LatLngBounds(sw, ne);
-
-        const overlay = customOverlay(data.image_url, bounds, this.map, 'OverlayView');
+        // The overlay is served as tiles cut on the server from the registered coverage
+        const overlay = new CoverageTileOverlay(result.data.coverage_id, this.map, result.complete);
         overlay.setOpacity(0.7);
         hideSpinner();
-        return { overlay, coverageIndices };
+
+        // A progressive response is a coarse preview; the same request without
+        // "progressive" waits for the full-resolution result on the server
+        let refined = null;
+        if (!result.complete) {
+            refined = this.requestCoverage({ ...body, tiles: true })
+                .then(full => {
+                    overlay.setCoverage(full.data.coverage_id, true);
+                    return full.coverageIndices;
+                })
+                .catch(error => {
+                    console.error('Error fetching full-resolution coverage:', error);
+                    return null;
+                });
+        }
+        return { overlay, coverageIndices: result.coverageIndices, refined };
+    }
+
+    async requestCoverage(body) {
+        const res = await fetch(`${config.APP_API}/calculate_blockage`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': `${COVERAGE_MIMETYPE}, application/json;q=0.9` },
+            body: JSON.stringify(body)
+        });
+        if ((res.headers.get('Content-Type') || '').startsWith(COVERAGE_MIMETYPE)) {
+            const decoded = decodeCoverageResponse(await res.arrayBuffer());
+            return {
+                data: { bounds: decoded.bounds, image_url: decoded.imageUrl, coverage_id: decoded.coverageId },
+                coverageIndices: decoded.coverageIndices,
+                complete: decoded.complete,
+            };
+        }
+        const data = await res.json();
+        const binaryCoverageIndices = Uint8Array.from(atob(data.coverage_indices.data), c => c.charCodeAt(0));
+        return {
+            data,
+            coverageIndices: new Uint32Array(binaryCoverageIndices.buffer),
+            complete: data.complete !== false,
+        };
+    }
+
+    // Replace a radar's coarse coverage indices with the full-resolution ones once they arrive,
+    // unless the radar has been updated or removed in the meantime
+    applyRefinedCoverage(id, result) {
+        if (!result.refined) return;
+        const coarseIndices = result.coverageIndices;
+        result.refined.then(coverageIndices => {
+            if (!coverageIndices || this.coverageIndicesMap.get(id) !== coarseIndices) return;
+            this.coverageIndicesMap.set(id, coverageIndices);
+            triggerReportGeneration();
+        });
     }
 
     toggleOverlay(id) {
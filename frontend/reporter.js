@@ -1,133 +1,44 @@
-let population;
-
-let coverage_3k;
-let coverage_6k;
-let coverage_10k;
-
-let coverage = null;
-
-let dataLoaded = false;
+let reportThreshold = '3k_ft';
 
 let currentlySelectedUsgsBasin = null;
 window.currentlySelectedUsgsBasin = currentlySelectedUsgsBasin;
 
-document.addEventListener("DOMContentLoaded", async () => {
-    loadDataUsingWorker();
-});
-
-// Loads population and coverage using worker
-function loadDataUsingWorker() {
-    const worker = new Worker("report-worker.js");
-    worker.postMessage({ config });
-    worker.onmessage = function(e) {
-        const { population: pop, coverage_3k: cov_3k, coverage_6k: cov_6k, coverage_10k: cov_10k } = e.data;
-        population = pop;
-        coverage_3k = cov_3k;
-        coverage_6k = cov_6k;
-        coverage_10k = cov_10k;
-        dataLoaded = true;
-        worker.terminate(); // Clean up
-        coverage = coverage_3k;
-    };
-}
-
 document.getElementById('threshold-range-slider').addEventListener('change', async (e) => {
     const thresholds = ['3k_ft', '6k_ft', '10k_ft'];
     const value = parseInt(e.target.value);
-    const threshold = thresholds[value];
-    
-    if (threshold === "3k_ft") coverage = coverage_3k;
-    else if (threshold === "6k_ft") coverage = coverage_6k;
-    else if (threshold === "10k_ft") coverage = coverage_10k;
+    reportThreshold = thresholds[value];
 
     triggerReportGeneration();
 });
 
+// The report is computed by the backend from its own population, NEXRAD
+// coverage and basin index data; only the custom radars' coverage is sent.
 async function generateReport(basinId = null) {
-    let pixelsCoveredByNexrad = 0;
-    let pixelsCoveredByCustom = 0;
-    let totalPixels = 0;
-
-    let populationCoveredByNexrad = 0;
-    let populationCoveredByCustom = 0;
-    let totalPopulation = 0;
-
     if (basinId === null) return null;
-    else { // Otherwise, if basin is selected, loop over basin indices only
-        const basinIncides = await getBasinIndices(basinId);
-        for (let i = 0; i < basinIncides.length; i++) {
-            const index = basinIncides[i];
-            const populationAtPixel = population[index];
-            const coverageAtPixel = coverage[index];
-
-            if (coverageAtPixel === 1) {
-                pixelsCoveredByNexrad++;
-                populationCoveredByNexrad += populationAtPixel;
-            }
-            else {
-                for (const coverageIndices of radarLayer.coverageIndicesMap.values()) {
-                    if (binaryIncludes(coverageIndices, index)) {
-                        pixelsCoveredByCustom++;
-                        populationCoveredByCustom += populationAtPixel;
-                        break;
-                    }
-                }
-            }
-            totalPopulation += populationAtPixel;
-        }
-        totalPixels = basinIncides.length;
+
+    const customCoverages = [];
+    for (const coverageIndices of radarLayer.coverageIndicesMap.values()) {
+        customCoverages.push({ data: encodeCoverageRuns(coverageIndices), encoding: 'runs-varint' });
     }
-    const pixelsNotCovered = totalPixels - pixelsCoveredByNexrad - pixelsCoveredByCustom;
-    const populationNotCovered = totalPopulation - populationCoveredByNexrad - populationCoveredByCustom;
-    const report = {
-        basinId,
-        area: {
-            coveredByNexrad: pixelsCoveredByNexrad,
-            coveredByCustom: pixelsCoveredByCustom,
-            notCovered: pixelsNotCovered,
-            total: totalPixels
-        },
-        population: {
-            coveredByNexrad: populationCoveredByNexrad,
-            coveredByCustom: populationCoveredByCustom,
-            notCovered: populationNotCovered,
-            total: totalPopulation
-        }
-    };
-    return report;
-}
 
-async function getBasinIndices(usgs_id) {
     try {
-        const response = await fetch(`${config.BASIN_IX_1D}/${usgs_id}.json`);
-        const result = await response.json();
-        const binaryData = Uint8Array.from(atob(result.data), c => c.charCodeAt(0));
-        const arrayType = dtypeMap[result.dtype];
-        const basinData = new arrayType(binaryData.buffer);
-        return basinData;
-        
+        const res = await fetch(`${config.APP_API}/report`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                basin_id: basinId,
+                threshold: reportThreshold,
+                custom_coverages: customCoverages,
+            }),
+        });
+        if (!res.ok) throw new Error(`Report request failed (${res.status})`);
+        return await res.json();
     } catch (error) {
-        console.error('Error loading basin data:', error);
+        console.error('Error generating report:', error);
+        return null;
     }
 }
 
-function binaryIncludes(arr, target) {
-  let low = 0;
-  let high = arr.length - 1;
-
-  while (low <= high) {
-    const mid = Math.floor((low + high) / 2);
-    if (arr[mid] === target) {
-      return true;
-    } else if (arr[mid] < target) {
-      low = mid + 1;
-    } else {
-      high = mid - 1;
-    }
-  }
-  return false; 
-}
-
 function triggerReportGeneration() {
     const event = new CustomEvent('generateReport');
     document.dispatchEvent(event);
@@ -230,10 +141,6 @@ document.getElementById("report-toggle-container").addEventListener('click', ()
         showError("A USGS basin must be selected.");
         return;
     }
-    if (coverage === null) {
-        showError("Waiting for data to load.");
-        return;
-    }
     piechartContainer.style.display = piechartContainer.style.display === "block" ? "none" : "block";
     toggleContainer.style.width = (currentWidth === "414px") ? "155px" : "414px";
     exitButton.style.display =  exitButton.style.display === "block" ? "none" : "block";